@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# background.py
+"""Estimate the background dose under the spots of a planar dose grid."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import numpy as np
+
+import roi
+
+# Methods of estimating the background:
+# global: a single background of the whole grid from the central axes
+# border: the median of the border of each spot ROI
+# plane: a plane fitted to the border of each spot ROI
+METHODS = ['global', 'border', 'plane']
+
+# Width (pixels) of the border of each ROI used for the local background
+BORDER = 2
+
+# Border pixels further from the fitted plane than this many (normalized)
+# median absolute deviations are excluded when the plane is refitted
+OUTLIER_MADS = 3.0
+
+
+def central_axis(grid):
+    """Background dose of the grid, the larger of the mean doses along the
+       central x and y axes between the spots."""
+
+    def mean(axis):
+        if axis == 'x':
+            return grid.dose[roi.coordinate_index(grid.y, 0.0),
+                             roi.coordinate_slice(grid.x, -8.0, 8.0)
+                             ].astype(float).mean()
+        return grid.dose[roi.coordinate_slice(grid.y, -8.0, 8.0),
+                         roi.coordinate_index(grid.x, 0.0)
+                         ].astype(float).mean()
+
+    return max(mean('x'), mean('y'))
+
+
+def border_mask(h, w, width=BORDER):
+    """Return the (h, w) mask of the border pixels of an ROI."""
+
+    mask = np.ones((h, w), dtype=bool)
+    mask[width:h - width, width:w - width] = False
+    return mask
+
+
+def border_median(rois, width=BORDER):
+    """Return the (..., 1, 1) median of the border of each ROI."""
+
+    values = rois[..., border_mask(*rois.shape[-2:], width=width)]
+    return np.median(values, axis=-1)[..., np.newaxis, np.newaxis]
+
+
+def fit_plane(rois, width=BORDER, outliers=OUTLIER_MADS):
+    """Fit a plane to the border of each ROI and return the (..., h, w)
+       plane under each ROI.
+
+       The plane is fitted to every border pixel by least squares, then
+       refitted without the pixels that are outliers of the first fit, such
+       as the tail of a neighbouring spot. Every ROI is fitted at once as
+       the ROIs share the same pixel layout."""
+
+    h, w = rois.shape[-2:]
+    j, i = np.mgrid[0:h, 0:w]
+    # Centre the pixel coordinates to keep the normal equations well posed
+    design = np.array([np.ones(h * w), (i.ravel() - (w - 1) / 2.0),
+                       (j.ravel() - (h - 1) / 2.0)]).T
+    mask = border_mask(h, w, width).ravel()
+    A = design[mask]
+    values = rois.reshape(rois.shape[:-2] + (h * w,))[..., mask]
+
+    def solve(weights):
+        # Weighted normal equations of every ROI
+        normal = np.dot((weights[..., np.newaxis] * A).swapaxes(-1, -2), A)
+        rhs = np.dot(weights * values, A)
+        return np.linalg.solve(normal, rhs[..., np.newaxis])[..., 0]
+
+    coefficients = solve(np.ones_like(values))
+    residuals = np.abs(values - np.dot(coefficients, A.T))
+    # Robust scale of the residuals of each ROI
+    mad = 1.4826 * np.median(residuals, axis=-1)[..., np.newaxis]
+    coefficients = solve(
+        (residuals <= outliers * np.maximum(mad, 1e-12)).astype(float))
+
+    plane = np.dot(coefficients, design.T)
+    return plane.reshape(rois.shape)
+
+
+def estimate(grid, rois, method='global'):
+    """Estimate the background dose under each ROI with the given method.
+
+       Returns the background that broadcasts against the (n, h, w) ROIs:
+       a scalar (global), the (n, 1, 1) border medians (border) or the
+       (n, h, w) fitted planes (plane)."""
+
+    if method == 'global':
+        return central_axis(grid)
+    elif method == 'border':
+        return border_median(rois)
+    elif method == 'plane':
+        return fit_plane(rois)
+    raise ValueError("Unknown background method: " + str(method))
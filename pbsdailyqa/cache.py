@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cache.py
+"""Cache the analysis of spot files keyed by the content of the file."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+import analysis
+import flatsym
+import opg
+import reftables
+import singleflight
+import timing
+
+# Directory used to store the analysis results on disk
+CACHE_ROOT = getattr(settings, 'PBS_DAILY_QA_CACHE_ROOT',
+                     os.path.join(tempfile.gettempdir(), 'pbsdailyqa'))
+
+# Number of analysis results kept in memory per process
+CACHE_SIZE = getattr(settings, 'PBS_DAILY_QA_CACHE_SIZE', 32)
+
+# Default values of the options of analysis.read_file
+DEFAULT_OPTIONS = {'gaussian': False, 'background_method': 'global'}
+
+_lock = threading.Lock()
+_results = OrderedDict()
+_hashes = OrderedDict()
+
+
+def _lru_get(store, key):
+    """Return the value for the key and mark it as recently used."""
+    with _lock:
+        value = store.pop(key, None)
+        if value is not None:
+            store[key] = value
+        return value
+
+
+def _lru_set(store, key, value):
+    """Store the value and evict the least recently used entries."""
+    with _lock:
+        store.pop(key, None)
+        store[key] = value
+        while len(store) > CACHE_SIZE:
+            store.popitem(last=False)
+
+
+def file_hash(filename):
+    """Return the SHA-1 of the file contents.
+
+       The hash is remembered for as long as the size and modification time
+       of the file do not change."""
+
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    sha = _lru_get(_hashes, key)
+    if sha is None:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+        sha = h.hexdigest()
+        _lru_set(_hashes, key, sha)
+    return sha
+
+
+def cache_key(sha, **options):
+    """Key of the analysis of the file content with the given options.
+
+       The key always includes the key of the reference table and a digest
+       of the flatness and symmetry regions, which are the defaults unless
+       others are given. Options given with their default value are left
+       out, so the key is the same whether or not they are given."""
+
+    options = dict((k, v) for k, v in options.items()
+                   if k not in DEFAULT_OPTIONS or v != DEFAULT_OPTIONS[k])
+    options.setdefault('reference', reftables.DEFAULT)
+    regions = np.ascontiguousarray(options.get('regions', flatsym.REGIONS))
+    options['regions'] = hashlib.sha1(regions.tobytes()).hexdigest()[:8]
+    key = [sha, 'v' + str(analysis.ANALYSIS_VERSION)]
+    key += [k + '-' + str(options[k]) for k in sorted(options)]
+    return '_'.join(key)
+
+
+def cache_path(key):
+    """Path to the stored analysis for the given key."""
+    return os.path.join(CACHE_ROOT, key[:2], key + '.npz')
+
+
+def save(path, spotdata):
+    """Write the spot data to the given path as an .npz file."""
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by another process in the meantime
+            pass
+
+    # Write to a temporary file first so that readers never see a
+    # partially written result
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **dict((k, np.asarray(v)) for k, v in spotdata.items()))
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        os.remove(tmp)
+
+
+def load(path):
+    """Read the spot data from the given .npz file."""
+
+    with np.load(path) as data:
+        return dict((k, data[k].item() if data[k].ndim == 0 else data[k])
+                    for k in data.files)
+
+
+def lookup(sha, **options):
+    """Return the cached analysis of the file content with the given hash,
+       or None if it has not been analysed."""
+
+    key = cache_key(sha, **options)
+    spotdata = _lru_get(_results, key)
+    if spotdata is None:
+        try:
+            with timing.stage('cache_load'):
+                spotdata = load(cache_path(key))
+        except (IOError, OSError, ValueError):
+            return None
+        _lru_set(_results, key, spotdata)
+    return spotdata
+
+
+def read_file(filename, date=None, **options):
+    """Return the analysis of the spot file, as analysis.read_file does,
+       from the in memory or on disk cache when it is available.
+
+       date: expected date (YYYYMMDD) in the exported file name, checked
+             whether or not the analysis is cached, so it is not part of the
+             cache key
+
+       The file is analysed once for the concurrent requests of every thread
+       and process. The cached spot data is shared and must be treated as
+       read only."""
+
+    sha = file_hash(filename)
+    key = cache_key(sha, **options)
+
+    def analyse():
+        spots, spotdata = analysis.read_file(filename, date=date, **options)
+        try:
+            with timing.stage('cache_save'):
+                save(cache_path(key), spotdata)
+        except (IOError, OSError):
+            pass
+        _lru_set(_results, key, spotdata)
+        return spotdata
+
+    # Concurrent requests for the same analysis wait for a single analysis
+    spotdata = singleflight.run(
+        key, cache_path(key) + '.lock', lambda: lookup(sha, **options),
+        analyse)
+    # The cached analysis may have been made without the expected date
+    opg.validate_date(spotdata['FileName'], date)
+    return spotdata['spots'], spotdata
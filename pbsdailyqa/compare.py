@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# compare.py
+"""Compare the spots of several PBS daily QA files against a reference."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import numpy as np
+
+import analysis
+import roi
+import sidecar
+import timing
+from background import central_axis
+
+# Results of each file that are compared to the reference
+VALUES = ['positionX', 'positionY', 'SpotSizeX', 'SpotSizeY']
+
+
+def key(prefix, name):
+    """Key of a derived result, e.g. key('delta', 'positionX') is
+       deltaPositionX."""
+    return prefix + name[0].upper() + name[1:]
+
+
+def read_stack(filenames, layout=roi.SPOT_LAYOUT):
+    """Read the spot ROIs of every file into a single stack.
+
+       Returns the (N, n, h, w) stack of ROIs, the (n, h) row and (n, w)
+       column coordinates shared by every file and the (N,) background dose
+       of each file. Raises ValueError if the files were not measured on the
+       same grid."""
+
+    rois = ys = xs = None
+    background = np.empty(len(filenames))
+    for i, filename in enumerate(filenames):
+        with timing.stage('parse'):
+            grid = sidecar.read_grid(filename)
+        with timing.stage('rois'):
+            r, y, x = roi.extract_rois(grid, layout)
+            if rois is None:
+                rois = np.empty((len(filenames),) + r.shape)
+                ys, xs = y, x
+            elif r.shape != rois.shape[1:] or \
+                    not np.allclose(y, ys) or not np.allclose(x, xs):
+                raise ValueError(
+                    "Spot file is not on the same grid as the other files: "
+                    + filename)
+            rois[i] = r
+        background[i] = central_axis(grid)
+    return rois, ys, xs, background
+
+
+def compare_files(filenames, references, layout=roi.SPOT_LAYOUT):
+    """Compare the spots of each file against the mean of the reference
+       files, e.g. the commissioning baseline or the files of the last week.
+
+       The files and references are analysed together in one batched pass
+       over their stacked ROIs.
+
+       Returns a dict of the (N, n) positionX/Y (cm) and SpotSizeX/Y (mm)
+       of the N files and their deltas from the reference (deltaPositionX
+       etc.), the (N, n, w) x and (N, n, h) y profiles, the (N, n, h, w)
+       difference of each spot from the reference spot as a percentage of
+       its maximum, and the same results of the reference
+       (referencePositionX etc.)."""
+
+    if not filenames or not references:
+        raise ValueError("At least one file and one reference are required")
+
+    rois, ys, xs, background = read_stack(
+        list(filenames) + list(references), layout)
+    result = analysis.analyse_spots(
+        rois, np.broadcast_to(ys, rois.shape[:-1]),
+        np.broadcast_to(xs, rois.shape[:-2] + xs.shape[-1:]),
+        background[:, np.newaxis, np.newaxis, np.newaxis])
+
+    n = len(filenames)
+    comparison = {
+        'xs': xs,
+        'ys': ys,
+        'ActualPositionY': layout['y'].tolist(),
+        'ActualPositionX': layout['x'].tolist(),
+        'ActualEnergy': layout['energy'].tolist(),
+    }
+    for k in VALUES + ['x', 'y', 'spots']:
+        comparison[k] = result[k][:n]
+        comparison[key('reference', k)] = result[k][n:].mean(axis=0)
+    for k in VALUES:
+        comparison[key('delta', k)] = \
+            comparison[k] - comparison[key('reference', k)]
+
+    reference = comparison['referenceSpots']
+    peak = np.max(reference, axis=(-2, -1))[..., np.newaxis, np.newaxis]
+    comparison['difference'] = 100 * (comparison['spots'] - reference) / peak
+    return comparison
@@ -1,6 +1,6 @@
 # from tzlocal import get_localzone
 # import datetime
-import re
+import opg
 
 dtformat = "%Y%m%d"
 
@@ -12,13 +12,10 @@ dtformat = "%Y%m%d"
 filename = "O:\\temp\\Adit\\dailyQAfiles\\position_20150818.opg"
 
 with open(filename, 'r') as f:
-    for i, line in enumerate(f):
-        if i == 5:
-            date = line
-            break
+    header = opg.read_header(f)
 
-print date
-print date.split('\\')[-1].split('.')[0].split('_')[0]#.rstrip('.opw')
-print re.findall('\d{8}', date)[0]
+print header['File Name']
+print opg.parse_date(header['File Name'])
+print opg.validate_header(header)
 
 # spot_position_file_date = 1 if (testdate == date) else 0
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# flatsym.py
+"""Flatness and symmetry of dose profiles through a planar dose grid."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import numpy as np
+from django.conf import settings
+
+# Each region is a dose profile through the point (x, y) at the given angle
+# (degrees counterclockwise from the x axis), with the range along the
+# profile used for flatness (start, stop) and for symmetry (left, right)
+# relative to the point (cm)
+REGION_DTYPE = [('name', 'U8'), ('x', float), ('y', float), ('angle', float),
+                ('start', float), ('stop', float),
+                ('left', float), ('right', float)]
+
+REGIONS = np.array(getattr(settings, 'PBS_DAILY_QA_REGIONS', [
+    ('X', 0.0, 0.0, 0.0, -7.0, 7.0, -8.0, 8.0),
+    ('Y', 0.0, 0.0, 90.0, -7.0, 7.0, -8.0, 8.6),
+]), dtype=REGION_DTYPE)
+
+# Metrics determined for each region, stored as <metric><region name>
+METRICS = ['flatness', 'symmetry', 'pointSymmetry']
+
+
+def region(name, angle=0.0, x=0.0, y=0.0, flatness=(-7.0, 7.0),
+           symmetry=(-8.0, 8.0)):
+    """Return a region, e.g. to add a diagonal profile to REGIONS:
+
+       np.append(REGIONS, region('XY', angle=45.0))"""
+
+    return np.array([(name, x, y, angle) + tuple(flatness) + tuple(symmetry)],
+                    dtype=REGION_DTYPE)
+
+
+def _interpolate(grid, px, py):
+    """Bilinearly interpolate the dose at the points (cm).
+
+       Points that lie on the grid return the exact dose and points outside
+       of the grid return nan."""
+
+    def index(coords, p):
+        step = (coords[-1] - coords[0]) / (len(coords) - 1)
+        f = (p - coords[0]) / step
+        # Snap points that lie on the grid to avoid rounding in the weights
+        nearest = np.round(f)
+        f = np.where(np.abs(f - nearest) < 1e-6, nearest, f)
+        outside = (f < 0) | (f > len(coords) - 1)
+        i = np.clip(np.floor(f), 0, len(coords) - 2).astype(int)
+        return i, f - i, outside
+
+    i, wx, outx = index(np.asarray(grid.x), px)
+    j, wy, outy = index(np.asarray(grid.y), py)
+    dose = grid.dose
+    values = (dose[j, i] * (1 - wx) * (1 - wy) +
+              dose[j, i + 1] * wx * (1 - wy) +
+              dose[j + 1, i] * (1 - wx) * wy +
+              dose[j + 1, i + 1] * wx * wy)
+    return np.where(outx | outy, np.nan, values)
+
+
+def profiles(grid, regions=REGIONS):
+    """Sample the profile of every region at the pixel spacing of the grid.
+
+       Returns the positions t (T,) along the profiles, symmetric about 0,
+       and the (R, T) dose of each region, nan where t is outside of the
+       grid."""
+
+    step = abs(grid.x[1] - grid.x[0])
+    extent = np.max(np.abs([regions[k] for k in
+                            ('start', 'stop', 'left', 'right')]))
+    m = int(np.ceil(extent / step - 1e-6))
+    t = step * np.arange(-m, m + 1)
+
+    angle = np.radians(regions['angle'])[:, np.newaxis]
+    px = regions['x'][:, np.newaxis] + t * np.cos(angle)
+    py = regions['y'][:, np.newaxis] + t * np.sin(angle)
+    return t, _interpolate(grid, px, py)
+
+
+def flatness_symmetry(grid, regions=REGIONS):
+    """Determine the flatness and symmetry of every region at once.
+
+       Returns a dict of (R,) arrays of:
+       flatness: 100 * (max - min) / (max + min) between start and stop
+       symmetry: half the percentage difference of the areas of the profile
+                 either side of the point, between left and right
+       pointSymmetry: largest percentage difference of the doses at equal
+                      distances either side of the point, relative to their
+                      sum, within the shorter side of left and right"""
+
+    t, values = profiles(grid, regions)
+    tol = 1e-3 * (t[1] - t[0])
+
+    def between(lo, hi):
+        return (t >= lo[:, np.newaxis] - tol) & (t <= hi[:, np.newaxis] + tol)
+
+    zero = np.zeros(len(regions))
+    flat = np.where(between(regions['start'], regions['stop']),
+                    values, np.nan)
+    dmax, dmin = np.nanmax(flat, axis=1), np.nanmin(flat, axis=1)
+
+    # Integrate the dose on each side of the point, including the point
+    step = t[1] - t[0]
+    area1 = np.where(between(regions['left'], zero), values, 0).sum(1) * step
+    area2 = np.where(between(zero, regions['right']), values, 0).sum(1) * step
+
+    # Pair each dose with the dose at the mirrored position
+    half = np.minimum(-regions['left'], regions['right'])
+    mirrored = values[:, ::-1]
+    points = np.where(between(-half, half),
+                      np.abs(values - mirrored) / (values + mirrored), np.nan)
+
+    return {
+        'flatness': 100 * (dmax - dmin) / (dmax + dmin),
+        'symmetry': 100 * np.abs(area1 - area2) / np.abs(area1 + area2) / 2,
+        'pointSymmetry': 100 * np.nanmax(points, axis=1),
+    }
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# gaussfit.py
+"""Fit rotated 2D Gaussians to a stack of spot ROIs."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import numpy as np
+
+# Number of Levenberg-Marquardt iterations used for every fit
+ITERATIONS = 10
+
+
+def gaussian(params, xs, ys):
+    """Evaluate the rotated 2D Gaussian of each parameter set.
+
+       params: (n, 6) array of amplitude, x0, y0, sigma x, sigma y, theta
+       xs: (n, w) column coordinates of each ROI
+       ys: (n, h) row coordinates of each ROI
+
+       Returns the (n, h, w) model along with the rotated coordinates
+       (u, v) of each pixel relative to the centre of the Gaussian."""
+
+    a, x0, y0, sx, sy, theta = [p[:, np.newaxis, np.newaxis]
+                                for p in params.T]
+    dx = xs[:, np.newaxis, :] - x0
+    dy = ys[:, :, np.newaxis] - y0
+    cos, sin = np.cos(theta), np.sin(theta)
+    u = cos * dx + sin * dy
+    v = cos * dy - sin * dx
+    return a * np.exp(-0.5 * ((u / sx) ** 2 + (v / sy) ** 2)), u, v
+
+
+def _jacobian(params, g, u, v):
+    """Partial derivatives of the model with respect to each parameter."""
+
+    a, x0, y0, sx, sy, theta = [p[:, np.newaxis, np.newaxis]
+                                for p in params.T]
+    cos, sin = np.cos(theta), np.sin(theta)
+    us, vs = u / sx ** 2, v / sy ** 2
+    return np.array([
+        g / a,
+        g * (us * cos - vs * sin),
+        g * (us * sin + vs * cos),
+        g * u ** 2 / sx ** 3,
+        g * v ** 2 / sy ** 3,
+        g * u * v * (1 / sy ** 2 - 1 / sx ** 2)])
+
+
+def fit_spots(spots, xs, ys, initial, iterations=ITERATIONS):
+    """Fit a rotated 2D Gaussian to every spot ROI of the stack at once.
+
+       spots: (n, h, w) background subtracted ROIs
+       xs, ys: (n, w) and (n, h) coordinates of each ROI
+       initial: (n, 6) starting parameters (i.e. from the FWHM analysis)
+
+       Returns the (n, 6) fitted parameters and the RMS residual of each
+       fit relative to its amplitude."""
+
+    params = np.array(initial, dtype=float)
+    n = len(params)
+    damping = np.full(n, 1e-3)
+
+    model, u, v = gaussian(params, xs, ys)
+    residual = spots - model
+    cost = np.sum(residual ** 2, axis=(1, 2))
+
+    for i in range(iterations):
+        # Normal equations of every spot: (J^T J + damping * D) step = J^T r
+        jac = _jacobian(params, model, u, v).reshape(6, n, -1)
+        jtj = np.einsum('pnk,qnk->npq', jac, jac)
+        jtr = np.einsum('pnk,nk->np', jac, residual.reshape(n, -1))
+        diag = np.diagonal(jtj, axis1=1, axis2=2)
+        diag = np.maximum(diag, 1e-12 * diag.max(axis=1)[:, np.newaxis])
+        lhs = jtj + (damping[:, np.newaxis] * diag)[..., np.newaxis] * \
+            np.eye(6)
+        step = np.linalg.solve(lhs, jtr[..., np.newaxis])[..., 0]
+
+        trial = params + step
+        trial[:, 3:5] = np.abs(trial[:, 3:5])
+        tmodel, tu, tv = gaussian(trial, xs, ys)
+        tresidual = spots - tmodel
+        tcost = np.sum(tresidual ** 2, axis=(1, 2))
+
+        # Accept the steps that improve each fit and adapt the damping
+        better = tcost < cost
+        damping = np.where(better, damping / 10, damping * 10)
+        params[better] = trial[better]
+        model[better], u[better], v[better] = \
+            tmodel[better], tu[better], tv[better]
+        residual[better] = tresidual[better]
+        cost[better] = tcost[better]
+
+    rms = np.sqrt(cost / residual[0].size) / np.abs(params[:, 0])
+    return params, rms
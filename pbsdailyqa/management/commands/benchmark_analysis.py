@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# benchmark_analysis.py
+"""Time each stage of the analysis and plotting of a synthetic spot file."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import json
+import shutil
+import timeit
+import tempfile
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from pbsdailyqa import analysis
+from pbsdailyqa import background
+from pbsdailyqa import cache
+from pbsdailyqa import compare
+from pbsdailyqa import flatsym
+from pbsdailyqa import opg
+from pbsdailyqa import plots
+from pbsdailyqa import reftables
+from pbsdailyqa import render
+from pbsdailyqa import roi
+from pbsdailyqa import sidecar
+from pbsdailyqa import synthetic
+
+# Spot file in the layout of an OmniPro export, with its acquisition date
+EXPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), 'fixtures', 'position_20150818.opg')
+EXPORT_DATE = '20150818'
+
+PLOT_VARIANTS = [(p, a, x) for p in ('profile', 'spot')
+                 for a in ('position', 'size') for x in ('x', 'y')]
+
+
+def stages(filename):
+    """Return the (name, function) of each stage to time for the file."""
+
+    grid = opg.read_opg(filename)
+    rois = roi.extract_rois(grid)[0]
+    sidecar.read_grid(filename)
+    spots, spotdata = analysis.read_file(filename)
+    y, ys = spotdata['y'], spotdata['ys']
+    halfmax = spotdata['Halfmax']
+
+    result = [
+        ('parse', lambda: opg.read_opg(filename)),
+        ('parse_export', lambda: opg.read_opg(
+            EXPORT, EXPORT_DATE, reftables.PIXEL_SPACING)),
+        ('sidecar', lambda: sidecar.read_grid(filename)),
+        ('rois', lambda: roi.extract_rois(grid)),
+        ('fwhm', lambda: analysis.fwhm_edges(halfmax, y, ys)),
+        ('flatness_symmetry', lambda: flatsym.flatness_symmetry(grid)),
+        ('read_file', lambda: analysis.read_file(filename)),
+        ('gaussian_fit', lambda: analysis.read_file(filename, gaussian=True)),
+        ('background_border', lambda: background.border_median(rois)),
+        ('background_plane', lambda: background.fit_plane(rois)),
+        ('compare_30', lambda: compare.compare_files(
+            [filename], [filename] * 30)),
+    ]
+    for variant in PLOT_VARIANTS:
+        result.append(('plot_' + '_'.join(variant),
+                       lambda v=variant: plots.render_png(spotdata, *v)))
+    return result
+
+
+def check_other_day(filename, date=EXPORT_DATE):
+    """Check that a rendered plot of the spot file taken on the date is not
+       served for a test of another day, as when the file is uploaded again
+       to a later test. Returns an error message or None."""
+
+    sha = cache.file_hash(filename)
+    params = ('profile', 'position', 'x')
+    render.render_plot(render.render_path(sha, *params), sha, *params,
+                       filename=filename, date=date)
+    try:
+        render.request_plot(sha, *params, filename=filename,
+                            date='20991231')
+    except ValueError:
+        return None
+    return "a plot of a file from %s was served for 20991231" % date
+
+
+def check_repeat_render(filename):
+    """Check that each plot of the spot file is the same when it is first
+       drawn by a new figure template, as in a new process, and when the
+       template draws it again. Returns the differing plots."""
+
+    spotdata = analysis.read_file(filename)[1]
+    differing = []
+    for variant in PLOT_VARIANTS:
+        template = plots.TEMPLATES[variant[:2]]()
+        first = template.render(spotdata, variant[2])
+        if template.render(spotdata, variant[2]) != first:
+            differing.append('_'.join(variant))
+    return differing
+
+
+def accuracy(filename, truth):
+    """Return the largest error of each result compared to the truth."""
+
+    spots, spotdata = analysis.read_file(filename)
+    return dict((k, float(np.max(np.abs(np.asarray(spotdata[k]) - v))))
+                for k, v in truth.items())
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the analysis and plots of a synthetic spot file and "
+            "compare the timings and accuracy against a stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help="Number of times each stage is timed (default: 20)")
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(cache.CACHE_ROOT, 'benchmark.json'),
+            help="Path of the stored baseline (default: %(default)s)")
+        parser.add_argument(
+            '--save', action='store_true', default=False,
+            help="Store the results as the new baseline")
+        parser.add_argument(
+            '--threshold', type=float, default=1.25,
+            help="Slowdown relative to the baseline that is reported as a "
+                 "regression (default: 1.25)")
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Seed of the synthetic spot file (default: 0)")
+
+    def handle(self, *args, **options):
+        # Generate a spot file with offset spots of varying sizes
+        rng = np.random.RandomState(options['seed'])
+        n = len(roi.SPOT_LAYOUT)
+        grid, truth = synthetic.make_grid(
+            offsets=rng.uniform(-0.3, 0.3, (n, 2)),
+            fwhm=rng.uniform(1.0, 1.8, (n, 2)),
+            seed=options['seed'])
+
+        # The parser must accept the layout of the exported files
+        try:
+            opg.read_opg(EXPORT, EXPORT_DATE, reftables.PIXEL_SPACING)
+        except (IOError, ValueError) as e:
+            raise CommandError("Could not read the export " + EXPORT +
+                               ": " + str(e))
+        error = check_other_day(EXPORT)
+        if error:
+            raise CommandError("Plot of another day: " + error)
+
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'position.opg')
+            synthetic.write_opg(filename, grid)
+            differing = check_repeat_render(filename)
+            if differing:
+                raise CommandError("Plots that differ when drawn again: " +
+                                   ", ".join(differing))
+            results = {'timings': {}, 'accuracy': accuracy(filename, truth)}
+            for name, func in stages(filename):
+                times = timeit.repeat(func, number=1,
+                                      repeat=options['repeat'])
+                results['timings'][name] = 1000 * float(np.median(times))
+        finally:
+            shutil.rmtree(directory)
+
+        baseline = None
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        regressions = []
+        self.stdout.write("%-28s %10s %10s %8s" %
+                          ("Stage", "ms", "baseline", "ratio"))
+        for name, ms in sorted(results['timings'].items()):
+            base = baseline['timings'].get(name) if baseline else None
+            line = "%-28s %10.3f" % (name, ms)
+            if base:
+                line += " %10.3f %8.2f" % (base, ms / base)
+                if ms / base > options['threshold']:
+                    regressions.append(name)
+                    line += "  SLOWER"
+            self.stdout.write(line)
+
+        self.stdout.write("\n%-28s %10s %10s" %
+                          ("Accuracy", "error", "baseline"))
+        for name, error in sorted(results['accuracy'].items()):
+            base = baseline['accuracy'].get(name) if baseline else None
+            line = "%-28s %10.5f" % (name, error)
+            if base is not None:
+                line += " %10.5f" % base
+                if error > base + 1e-6:
+                    regressions.append(name)
+                    line += "  WORSE"
+            self.stdout.write(line)
+
+        if options['save']:
+            directory = os.path.dirname(options['baseline'])
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(options['baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write("\nSaved the baseline to " + options['baseline'])
+        elif regressions:
+            raise CommandError("Regressions compared to the baseline: " +
+                               ", ".join(regressions))
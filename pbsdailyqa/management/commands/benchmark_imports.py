@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# benchmark_imports.py
+"""Check the time a new worker process takes to import the views."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import sys
+import json
+import subprocess
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that should only be imported by the code paths that need them
+LAZY_MODULES = ['matplotlib', 'mpl_toolkits', 'scipy', 'pandas']
+
+# Time (ms) allowed to set up Django and import the views in a new process
+IMPORT_BUDGET = getattr(settings, 'PBS_DAILY_QA_IMPORT_BUDGET', 1500)
+
+# Run in a new process as a worker would start, printing the timings (s)
+SCRIPT = """
+import sys, json
+from timeit import default_timer
+start = default_timer()
+import django
+django.setup()
+setup = default_timer()
+import pbsdailyqa.views
+end = default_timer()
+print(json.dumps({
+    'setup': setup - start, 'views': end - setup, 'total': end - start,
+    'modules': sorted(m for m in sys.modules
+                      if m.split('.')[0] in %r)}))
+"""
+
+
+def import_times():
+    """Return the timings and lazy modules loaded by a new process."""
+
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT % (LAZY_MODULES,)])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class Command(BaseCommand):
+    help = ("Time setting up Django and importing the pbsdailyqa views in a "
+            "new process and check it against the import time budget.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help="Number of processes that are timed (default: 5)")
+        parser.add_argument(
+            '--budget', type=float, default=IMPORT_BUDGET,
+            help="Median time (ms) allowed for the imports "
+                 "(default: %(default)s)")
+
+    def handle(self, *args, **options):
+        runs = [import_times() for i in range(options['repeat'])]
+
+        timings = {}
+        self.stdout.write("%-28s %10s" % ("Stage", "ms"))
+        for name in ('setup', 'views', 'total'):
+            timings[name] = 1000 * float(np.median([r[name] for r in runs]))
+            self.stdout.write("%-28s %10.1f" % (name, timings[name]))
+
+        errors = []
+        if timings['total'] > options['budget']:
+            errors.append("the imports took %.1f ms, over the budget of "
+                          "%.1f ms" % (timings['total'], options['budget']))
+        modules = sorted(set(m for r in runs for m in r['modules']))
+        if modules:
+            errors.append("modules that should be imported lazily were "
+                          "imported: " + ", ".join(modules))
+        if errors:
+            raise CommandError("; ".join(errors))
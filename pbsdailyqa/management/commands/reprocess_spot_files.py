@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# reprocess_spot_files.py
+"""Analyse every spot file in the upload archive into the results table."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from qatrack.qa import models
+from tzlocal import get_localzone
+
+from pbsdailyqa import analysis
+from pbsdailyqa import results
+
+dtformat = "%Y-%m-%d"
+
+
+def spot_files(units=None):
+    """Return a (TestListInstance id, unit id, date, file name) job for each
+       uploaded spot file that exists in the archive."""
+
+    tests = models.TestInstance.objects.filter(
+        unit_test_info__test_id=settings.PBS_DAILY_QA_SPOTFILE_TEST_ID,
+        test_list_instance__isnull=False
+    ).exclude(string_value__isnull=True).exclude(string_value='')
+    if units:
+        tests = tests.filter(unit_test_info__unit_id__in=units)
+
+    jobs = []
+    for tli, unit, work_completed, name in tests.values_list(
+            'test_list_instance_id', 'unit_test_info__unit_id',
+            'test_list_instance__work_completed', 'string_value'):
+        filename = os.path.join(settings.UPLOAD_ROOT, str(tli), name)
+        if os.path.isfile(filename):
+            date = work_completed.astimezone(
+                get_localzone()).strftime(dtformat)
+            jobs.append((tli, unit, date, filename))
+    return jobs
+
+
+class Command(BaseCommand):
+    help = ("Analyse the uploaded PBS daily QA spot files into the results "
+            "table. Files already analysed by the current version of the "
+            "analysis are skipped unless --full is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true', default=False,
+            help="Discard the existing results and reprocess every file")
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help="Number of worker processes (default: number of CPUs)")
+        parser.add_argument(
+            '--unit', type=int, action='append', dest='units',
+            help="Only process the files of this unit id (repeatable)")
+        parser.add_argument(
+            '--output', default=results.RESULTS_PATH,
+            help="Path of the results table (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        path = options['output']
+
+        # Keep the rows of the current analysis version, dropping the
+        # results of older versions so that those files are reprocessed
+        if options['full']:
+            current = []
+            results.write_rows(current, path)
+        else:
+            current = results.keep_rows(
+                lambda r: int(r['version']) == analysis.ANALYSIS_VERSION,
+                path)
+        done = results.processed(current)
+
+        jobs = [j for j in spot_files(options['units']) if j[0] not in done]
+        self.stdout.write("%d spot files already processed, %d to process" %
+                          (len(done), len(jobs)))
+        if not jobs:
+            return
+
+        # Rows are appended as each file completes, so that an interrupted
+        # run resumes where it left off
+        pool = multiprocessing.Pool(max(1, options['processes']))
+        failed = 0
+        try:
+            for i, (tli, rows, error) in enumerate(pool.imap_unordered(
+                    results.analyse, jobs, chunksize=4)):
+                if error:
+                    failed += 1
+                    self.stderr.write(
+                        "TestListInstance %s: %s" % (tli, error))
+                else:
+                    results.append_rows(rows, path)
+                if (i + 1) % 100 == 0:
+                    self.stdout.write("%d / %d" % (i + 1, len(jobs)))
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        self.stdout.write("Processed %d spot files, %d failed" %
+                          (len(jobs) - failed, failed))
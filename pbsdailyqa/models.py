@@ -1,3 +1,6 @@
 from django.db import models
 
 # Create your models here.
+
+# Connect the signal handlers of the app
+import signals  # noqa
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# opg.py
+"""Read OmniPro I'mRT ASCII (OPG) planar dose exports."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import re
+import numpy as np
+
+
+class DoseGrid(object):
+    """Planar dose matrix with numeric coordinates and the file header.
+
+       dose: 2D float array indexed as [row, column]
+       x: column (crossplane) coordinates
+       y: row (inplane) coordinates
+       header: dictionary of the key / value pairs in the ascii header"""
+
+    def __init__(self, dose, x, y, header):
+        self.dose = dose
+        self.x = x
+        self.y = y
+        self.header = header
+
+    @property
+    def filename(self):
+        """Name of the file as recorded by OmniPro at export time."""
+        return self.header.get('File Name', '')
+
+    @property
+    def date(self):
+        """Acquisition date (YYYYMMDD) embedded in the exported file name."""
+        return parse_date(self.filename)
+
+
+def parse_date(filename):
+    """Return the first 8 digit date found in the given string or None."""
+
+    dates = re.findall(r'\d{8}', filename)
+    return dates[0] if len(dates) else None
+
+
+def file_date(date):
+    """Return the ISO (YYYY-MM-DD) date as the YYYYMMDD date embedded in the
+       exported file names."""
+    return date.replace('-', '')
+
+
+def read_header(f):
+    """Read the ascii header block from an open OPG file object.
+
+       The file is left positioned just after the end of the header."""
+
+    header = {}
+    # Use readline rather than iteration so that the rest of the file can
+    # still be read by the caller (Python 2 file read-ahead)
+    for line in iter(f.readline, ''):
+        line = line.strip()
+        if line.startswith('</asciiheader>'):
+            break
+        if ':' in line and not line.startswith('<'):
+            key, value = line.split(':', 1)
+            header[key.strip()] = value.strip()
+    return header
+
+
+def validate_date(filename, date=None):
+    """Check that the date in the exported file name matches the given date
+       (YYYYMMDD). The file name need not contain a date if none is given."""
+
+    if date is None:
+        return
+    filedate = parse_date(filename)
+    if filedate is None:
+        raise ValueError("No date found in the file name: " + filename)
+    if filedate != date:
+        raise ValueError("File date " + filedate + " does not match " + date)
+
+
+def validate_header(header, date=None):
+    """Check that the header describes a dose plane acquired on the given
+       date (YYYYMMDD), if any.
+
+       Returns the number of rows and columns of the dose matrix or raises
+       ValueError if the header is invalid."""
+
+    validate_date(header.get('File Name', ''), date)
+
+    try:
+        nrows = int(header['No. of Rows'])
+        ncols = int(header['No. of Columns'])
+    except (KeyError, ValueError):
+        raise ValueError("Invalid grid dimensions in the header")
+    if nrows < 2 or ncols < 2:
+        raise ValueError("Invalid grid dimensions: %d x %d" % (nrows, ncols))
+    return nrows, ncols
+
+
+def validate_spacing(coords, spacing=None):
+    """Check that the coordinates increase in uniform steps of the given
+       spacing (cm), if any. Returns the spacing."""
+
+    steps = np.diff(coords)
+    step = steps.mean()
+    if step <= 0 or np.any(np.abs(steps - step) > 1e-3 * step):
+        raise ValueError("Non uniform pixel spacing")
+    if spacing is not None and abs(step - spacing) > 1e-3 * spacing:
+        raise ValueError("Pixel spacing %g does not match %g" %
+                         (step, spacing))
+    return step
+
+
+def validate_grid(grid, date=None, spacing=None):
+    """Check the header and coordinates of a DoseGrid that has already been
+       read against the optional date (YYYYMMDD) and pixel spacing (cm)."""
+
+    validate_header(grid.header, date)
+    validate_spacing(grid.x, spacing)
+    validate_spacing(grid.y, spacing)
+
+
+def read_opg(filename, date=None, spacing=None):
+    """Read an OPG file and return a DoseGrid of the dose plane.
+
+       The header is validated against the optional date (YYYYMMDD) and
+       pixel spacing (cm) before the dose matrix is read, which is then
+       parsed row by row into a preallocated array. ValueError is raised as
+       soon as the file is found to be invalid."""
+
+    with open(filename, 'r') as f:
+        header = read_header(f)
+        nrows, ncols = validate_header(header, date)
+
+        # Locate the column coordinate row (i.e. X[cm]) of the ascii body
+        for line in iter(f.readline, ''):
+            if line.startswith('X['):
+                x = np.array([v for v in line.split('\t')[1:] if v.strip()],
+                             dtype=float)
+                break
+        else:
+            raise ValueError("No dose matrix found in: " + filename)
+        if len(x) != ncols:
+            raise ValueError("Expected %d columns, found %d in: %s" %
+                             (ncols, len(x), filename))
+        validate_spacing(x, spacing)
+
+        # The remaining lines contain the row coordinate label (i.e. Y[cm])
+        # followed by each row coordinate and its tab separated dose values
+        f.readline()
+        values = np.empty((nrows, ncols + 1))
+        row = 0
+        for line in iter(f.readline, ''):
+            if line.startswith('</asciibody>'):
+                break
+            if row == nrows:
+                raise ValueError("Too many rows in: " + filename)
+            rowvalues = np.fromstring(line, sep=' ')
+            if rowvalues.size != ncols + 1:
+                raise ValueError("Incomplete row %d in: %s" % (row, filename))
+            values[row] = rowvalues
+            row += 1
+
+    if row != nrows:
+        raise ValueError("Incomplete dose matrix in: " + filename)
+    y = values[:, 0].copy()
+    validate_spacing(y, spacing)
+
+    return DoseGrid(values[:, 1:], x, y, header)
@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# plots.py
+"""Plot the PBS daily QA analysis using reusable figure templates."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import io
+import threading
+
+import numpy as np
+from matplotlib import cm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import Circle, Ellipse
+from matplotlib.ticker import ScalarFormatter
+from mpl_toolkits.axes_grid1 import ImageGrid
+
+import timing
+import verdicts
+
+# Number of rows and columns of spots shown in each plot
+NROWS, NCOLS = 4, 4
+
+_lock = threading.Lock()
+_templates = {}
+
+
+def fill_verts(xs, ys, where):
+    """Return the polygons filling between zero and the curve where the
+       condition is true, as matplotlib's fill_between would."""
+
+    polys = []
+    edges = np.diff(np.concatenate(([0], where.astype(int), [0])))
+    for start, stop in zip(np.nonzero(edges == 1)[0],
+                           np.nonzero(edges == -1)[0]):
+        x, y = xs[start:stop], ys[start:stop]
+        n = len(x)
+        verts = np.zeros((2 * n + 2, 2))
+        verts[0] = x[0], y[0]
+        verts[n + 1] = x[-1], y[-1]
+        verts[1:n + 1, 0] = x
+        verts[n + 2:, 0] = x[::-1]
+        verts[n + 2:, 1] = y[::-1]
+        polys.append(verts)
+    return polys
+
+
+class KeepTicksFormatter(ScalarFormatter):
+    """Tick formatter that leaves the labels of all but the given tick
+       indices blank.
+
+       The indices are taken from the ticks located when the axis is drawn,
+       so the labels follow the limits of each plot."""
+
+    def __init__(self, keep):
+        super(KeepTicksFormatter, self).__init__()
+        self.keep = keep
+
+    def __call__(self, x, pos=None):
+        if pos is not None and len(self.locs):
+            keep = [k % len(self.locs) for k in self.keep]
+            if pos not in keep:
+                return ''
+        return super(KeepTicksFormatter, self).__call__(x, pos)
+
+
+def show_tick_labels(axis, keep):
+    """Only show the tick labels of the given tick indices."""
+
+    axis.set_major_formatter(KeepTicksFormatter(keep))
+
+
+class FigureTemplate(object):
+    """Figure with its axes and artists laid out once per process.
+
+       Each plot only updates the data of the existing artists, which is
+       much faster than creating the figure, axes and artists again."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.figure = Figure(dpi=72, facecolor="white")
+        dpi = self.figure.get_dpi()
+        self.figure.set_size_inches(720 / dpi, 600 / dpi)
+        self.canvas = FigureCanvas(self.figure)
+        self.layout()
+
+    def layout(self):
+        """Create the axes and artists of the figure."""
+        raise NotImplementedError
+
+    def update(self, spotdata, axis):
+        """Update the artists with the given spot data."""
+        raise NotImplementedError
+
+    def render(self, spotdata, axis):
+        """Return the figure drawn with the given spot data as PNG data."""
+
+        with self.lock:
+            with timing.stage('figure'):
+                self.update(spotdata, axis)
+            with timing.stage('png'):
+                f = io.BytesIO()
+                self.canvas.print_png(f)
+            return f.getvalue()
+
+
+class ProfileTemplate(FigureTemplate):
+    """Grid of spot line profiles with tolerance bands filled below them."""
+
+    # Colors and opacity of each band filled below the profile
+    bands = []
+
+    def layout(self):
+        self.axes = []
+        self.profiles = []
+        self.fills = []
+        for k in range(NROWS * NCOLS):
+            if (k % NCOLS == 0):
+                ax = self.figure.add_subplot(NROWS, NCOLS, k + 1)
+                axy0 = ax
+            else:
+                # Share the y axis from the left most plot
+                ax = self.figure.add_subplot(
+                    NROWS, NCOLS, k + 1, sharey=axy0)
+                ax.tick_params(labelleft=False)
+            if (k < (NROWS - 1) * NCOLS):
+                ax.tick_params(labelbottom=False)
+            else:
+                ax.set_xlabel('Millimeters', fontsize=10)
+            self.profiles.append(ax.plot([], [])[0])
+            fills = []
+            for color, alpha in self.bands:
+                fill = PolyCollection([], color=color, alpha=alpha)
+                ax.add_collection(fill, autolim=False)
+                fills.append(fill)
+            self.fills.append(fills)
+            if k >= (NROWS - 1) * NCOLS:
+                show_tick_labels(ax.xaxis, (0, -1))
+            if k % NCOLS == 0:
+                show_tick_labels(ax.yaxis, (0, -1))
+            ax.set_title('', fontsize=10, color='blue')
+            self.axes.append(ax)
+
+    def update_profile(self, k, xs, profile, where):
+        """Update the profile and fill the bands matching each condition."""
+
+        self.profiles[k].set_data(xs, profile)
+        for fill, w in zip(self.fills[k], where):
+            fill.set_verts(fill_verts(xs, profile, w))
+
+    def rescale(self):
+        """Rescale the axes to the updated profiles."""
+
+        for k, ax in enumerate(self.axes):
+            ax.relim()
+            ax.update_datalim([(self.profiles[k].get_xdata()[0], 0)])
+        for k, ax in enumerate(self.axes):
+            ax.autoscale_view()
+
+
+class ProfilePositionTemplate(ProfileTemplate):
+    """Spot profiles annotated with the position tolerances."""
+
+    bands = [('green', 0.2), ('green', 0.2), ('orange', 0.2),
+             ('orange', 0.2), ('red', 0.2), ('red', 0.2)]
+
+    def layout(self):
+        super(ProfilePositionTemplate, self).layout()
+        self.positions = []
+        self.actual = []
+        for ax in self.axes:
+            self.positions.append(ax.axvline(
+                x=0, linewidth=2, color='r', ls='dashed'))
+            self.actual.append(ax.axvline(x=0, linewidth=1, color='b'))
+
+    def update(self, spotdata, axis):
+        spots = spotdata['x'] if axis == 'x' else spotdata['y']
+        coords = spotdata['xs'] if axis == 'x' else spotdata['ys']
+        position = spotdata['positionX'] if axis == 'x' else \
+            spotdata['positionY']
+        actual = spotdata['ActualPositionX'] if axis == 'x' else \
+            spotdata['ActualPositionY']
+        p, t = spotdata['PositionTolerance']
+        # Highlight the band of the verdict of each spot
+        status = verdicts.status(np.subtract(position, actual), (p, t))
+
+        for k in range(len(self.axes)):
+            xs = coords[k].astype(np.float32)
+            actpos = actual[k]
+            pos = position[k]
+            opacity = [0.2, 0.2, 0.2]
+            opacity[status[k]] = 0.5
+            opacity_pass, opacity_tol, opacity_act = opacity
+            self.update_profile(k, xs, spots[k], [
+                np.logical_and(xs >= actpos, xs <= actpos + p),
+                np.logical_and(xs <= actpos, xs >= actpos - p),
+                np.logical_and(xs >= actpos + p, xs <= actpos + t),
+                np.logical_and(xs <= actpos - p, xs >= actpos - t),
+                (xs >= actpos + t),
+                (xs <= actpos - t)])
+            for fill, alpha in zip(self.fills[k], [
+                    opacity_pass, opacity_pass, opacity_tol, opacity_tol,
+                    opacity_act, opacity_act]):
+                fill.set_alpha(alpha)
+            self.positions[k].set_xdata([pos, pos])
+            self.actual[k].set_xdata([actpos, actpos])
+            self.axes[k].title.set_text(
+                axis + '(' + "%g" % spotdata['ActualPositionY'][k]
+                + ',' + "%g" % spotdata['ActualPositionX'][k] + ', R' +
+                str(spotdata['ActualEnergy'][k]) + ')')
+        self.rescale()
+
+
+class ProfileSizeTemplate(ProfileTemplate):
+    """Spot profiles annotated with the FWHM and the size tolerances."""
+
+    bands = [('green', 0.2), ('green', 0.2), ('orange', 0.2),
+             ('orange', 0.2), ('red', 0.2), ('red', 0.2)]
+
+    def layout(self):
+        super(ProfileSizeTemplate, self).layout()
+        self.fwhm = []
+        for ax in self.axes:
+            self.fwhm.append([
+                ax.plot([], [], color='red', linewidth=2, ls='dashed')[0]
+                for i in range(3)])
+
+    def update(self, spotdata, axis):
+        spots = spotdata['x'] if axis == 'x' else spotdata['y']
+        coords = spotdata['xs'] if axis == 'x' else spotdata['ys']
+        edges = spotdata['fwhmX'] if axis == 'x' else spotdata['fwhmY']
+        Halfmax = spotdata['Halfmax']
+
+        for k in range(len(self.axes)):
+            xs = coords[k].astype(np.float32)
+            if axis == 'y':
+                actsize = spotdata['ActualFWHMY'][k] / 20
+                actpos = spotdata['ActualPositionY'][k]
+                pos = spotdata['positionY'][k]
+                actsigma = spotdata['ActualSigmaY'][k]
+            elif axis == 'x':
+                actsize = spotdata['ActualFWHMX'][k] / 20
+                actpos = spotdata['ActualPositionX'][k]
+                pos = spotdata['positionX'][k]
+                actsigma = spotdata['ActualSigmaX'][k]
+            p, t = spotdata['SizeTolerance']
+            fwhm = edges[k, 0]
+            left, right, top = self.fwhm[k]
+            left.set_data([fwhm, fwhm], [0, Halfmax[k]])
+            right.set_data([2 * pos - fwhm, 2 * pos - fwhm], [0, Halfmax[k]])
+            top.set_data([fwhm, 2 * pos - fwhm], [Halfmax[k], Halfmax[k]])
+            self.update_profile(k, xs, spots[k], [
+                np.logical_and(
+                    (xs >= actpos),
+                    (xs <= (actpos + actsize) + (actsize * p))),
+                np.logical_and(
+                    (xs <= actpos),
+                    (xs >= (actpos - actsize) - (actsize * p))),
+                np.logical_and(
+                    (xs >= (actpos + actsize) + (actsize * p)),
+                    (xs <= (actpos + actsize) + (actsize * t))),
+                np.logical_and(
+                    (xs <= (actpos - actsize) - (actsize * p)),
+                    (xs >= (actpos - actsize) - (actsize * t))),
+                (xs >= (actpos + actsize) + (actsize * t)),
+                (xs <= (actpos - actsize) - (actsize * t))])
+            self.axes[k].title.set_text(
+                axis + '(' + "%g" % spotdata['ActualPositionY'][k]
+                + ',' + "%g" % spotdata['ActualPositionX'][k] + ':'
+                + str("%.3g" % actsigma) + ')')
+        self.rescale()
+
+
+class SpotTemplate(FigureTemplate):
+    """Grid of spot images."""
+
+    cbar_mode = None
+
+    def layout(self):
+        self.grid = ImageGrid(
+            self.figure, 111, nrows_ncols=(NROWS, NCOLS),
+            axes_pad=0.3,
+            cbar_mode=self.cbar_mode)
+        self.images = []
+        for k in range(NROWS * NCOLS):
+            ax = self.grid[k]
+            self.images.append(ax.imshow(
+                np.zeros((2, 2)), aspect='equal', extent=(0, 1, 1, 0),
+                **self.image_kwargs))
+            ax.set_title('', fontsize=10, color='blue')
+            # Only show the second and second last tick labels
+            if k >= (NROWS - 1) * NCOLS:
+                ax.set_xlabel('Millimeters', fontsize=10)
+                show_tick_labels(ax.xaxis, (1, -2))
+            if (k % NCOLS == 0):
+                ax.set_ylabel('Millimeters', fontsize=10)
+                show_tick_labels(ax.yaxis, (1, -2))
+
+    def update_image(self, k, image, xs, ys):
+        """Update the image of the spot and its extent."""
+
+        ax = self.grid[k]
+        self.images[k].set_data(image)
+        self.images[k].set_extent((xs[0], xs[-1], ys[-1], ys[0]))
+        ax.set_xlim(xs[0], xs[-1])
+        ax.set_ylim(ys[-1], ys[0])
+
+
+class SpotPositionTemplate(SpotTemplate):
+    """Spot images annotated with the position tolerances."""
+
+    cbar_mode = 'single'
+    image_kwargs = {'cmap': 'jet', 'vmin': 0}
+
+    def layout(self):
+        super(SpotPositionTemplate, self).layout()
+        self.grid.cbar_axes[0].colorbar(self.images[-1])
+        self.circles = []
+        self.actual = []
+        self.positions = []
+        for ax in self.grid:
+            # Pass and tolerance circles, sized to the reference on update
+            circles = [Circle((0, 0), 1, color='white', fill=False,
+                              ls='solid', linewidth=1) for _ in range(2)]
+            for c in circles:
+                ax.add_patch(c)
+            self.circles.append(circles)
+            self.actual.append([
+                ax.axvline(x=0, linewidth=1, color='white'),
+                ax.axhline(y=0, linewidth=1, color='white')])
+            self.positions.append([
+                ax.axvline(x=0, linewidth=1, color='black', ls='dashed'),
+                ax.axhline(y=0, linewidth=1, color='black', ls='dashed')])
+
+    def update(self, spotdata, axis):
+        spots = spotdata['spots']
+        ActualPositionY = spotdata['ActualPositionY']
+        ActualPositionX = spotdata['ActualPositionX']
+        radii = spotdata['PositionTolerance']
+
+        for k in range(NROWS * NCOLS):
+            xs = spotdata['xs'][k].astype(np.float32)
+            ys = spotdata['ys'][k].astype(np.float32)
+            self.update_image(k, spots[k], xs, ys)
+            self.images[k].set_clim(0, np.max(spots[k]))
+            for c, r in zip(self.circles[k], radii):
+                c.center = (ActualPositionX[k], ActualPositionY[k])
+                c.set_radius(r)
+            vline, hline = self.actual[k]
+            vline.set_xdata([ActualPositionX[k]] * 2)
+            hline.set_ydata([ActualPositionY[k]] * 2)
+            vline, hline = self.positions[k]
+            vline.set_xdata([spotdata['positionX'][k]] * 2)
+            hline.set_ydata([spotdata['positionY'][k]] * 2)
+            self.grid[k].title.set_text(
+                "%g" % ActualPositionY[k]
+                + ',' + "%g" % ActualPositionX[k] + ':'
+                + 'R' + str(spotdata['ActualEnergy'][k]))
+
+
+class SpotSizeTemplate(SpotTemplate):
+    """Spot images above half max annotated with the size tolerances."""
+
+    image_kwargs = {'cmap': 'Blues', 'vmin': 0, 'vmax': 800}
+
+    def layout(self):
+        super(SpotSizeTemplate, self).layout()
+        self.fwhm = []
+        self.ellipses = []
+        for ax in self.grid:
+            self.fwhm.append([
+                ax.plot([], [], color='white', linewidth=1)[0]
+                for i in range(2)])
+            ellipses = [
+                Ellipse((0, 0), width=0, height=0, color=color,
+                        fill=False, ls='solid', linewidth=1)
+                for color in ('orange', 'red')]
+            for e in ellipses:
+                ax.add_patch(e)
+            self.ellipses.append(ellipses)
+
+    def update(self, spotdata, axis):
+        spots = spotdata['spots']
+        Halfmax = spotdata['Halfmax']
+        fwhmY = spotdata['fwhmY']
+        fwhmX = spotdata['fwhmX']
+        positionY = spotdata['positionY']
+        positionX = spotdata['positionX']
+        sigmaY = spotdata['sigmaY']
+        sigmaX = spotdata['sigmaX']
+        ActualSigmaY = spotdata['ActualSigmaY']
+        ActualSigmaX = spotdata['ActualSigmaX']
+
+        for k in range(NROWS * NCOLS):
+            xs = spotdata['xs'][k].astype(np.float32)
+            ys = spotdata['ys'][k].astype(np.float32)
+            self.update_image(k, (spots[k] >= (Halfmax[k])) * 500, xs, ys)
+            # Plot FWHM X and FWHM Y
+            fx, fy = self.fwhm[k]
+            fx.set_data([fwhmX[k, 0], fwhmX[k, 1]],
+                        [positionY[k], positionY[k]])
+            fy.set_data([positionX[k], positionX[k]],
+                        [fwhmY[k, 0], fwhmY[k, 1]])
+            # Plot Sigma Tolerance
+            for e, tol in zip(self.ellipses[k], spotdata['SizeTolerance']):
+                e.center = (positionX[k], positionY[k])
+                e.width = 2 * (sigmaX[k] / 10) * (1 + tol)
+                e.height = 2 * (sigmaY[k] / 10) * (1 + tol)
+                e.stale = True
+            self.grid[k].title.set_text(
+                "%g" % spotdata['ActualPositionY'][k]
+                + ',' + "%g" % spotdata['ActualPositionX'][k] + ',' +
+                'Y:' + str("%.3g" % ActualSigmaY[k]) + ',' + 'X:'
+                + str("%.3g" % ActualSigmaX[k]))
+
+
+class OverlayTemplate(ProfileTemplate):
+    """Spot profiles of every compared file overlaid on the reference."""
+
+    def layout(self):
+        super(OverlayTemplate, self).layout()
+        # The profile of the base template shows the reference
+        for line in self.profiles:
+            line.set_color('black')
+            line.set_linestyle('dashed')
+            line.set_linewidth(2)
+            line.set_zorder(3)
+        self.overlays = [[] for ax in self.axes]
+
+    def update(self, comparison, axis):
+        profiles = comparison['x'] if axis == 'x' else comparison['y']
+        reference = comparison['referenceX'] if axis == 'x' else \
+            comparison['referenceY']
+        coords = comparison['xs'] if axis == 'x' else comparison['ys']
+        delta = comparison['deltaPositionX'] if axis == 'x' else \
+            comparison['deltaPositionY']
+        # Color the files from the first (red) to the last (blue)
+        colors = cm.jet(np.linspace(1, 0, len(profiles)))
+
+        for k, ax in enumerate(self.axes):
+            xs = coords[k].astype(np.float32)
+            self.update_profile(k, xs, reference[k], [])
+            lines = self.overlays[k]
+            while len(lines) < len(profiles):
+                lines.append(ax.plot([], [], linewidth=1)[0])
+            for i, line in enumerate(lines):
+                if i < len(profiles):
+                    line.set_data(xs, profiles[i, k])
+                    line.set_color(colors[i])
+                    line.set_visible(True)
+                else:
+                    line.set_data([], [])
+                    line.set_visible(False)
+            ax.title.set_text(
+                axis + '(' + "%g" % comparison['ActualPositionY'][k]
+                + ',' + "%g" % comparison['ActualPositionX'][k] + '):'
+                + "%+.2f" % (delta[0, k] * 10))
+        self.rescale()
+
+
+class DifferenceTemplate(SpotTemplate):
+    """Difference of the spots of the first compared file from the
+       reference, as a percentage of the maximum of the reference spot."""
+
+    cbar_mode = 'single'
+    image_kwargs = {'cmap': 'RdBu_r'}
+
+    def layout(self):
+        super(DifferenceTemplate, self).layout()
+        self.grid.cbar_axes[0].colorbar(self.images[-1])
+        self.reference = []
+        self.positions = []
+        for ax in self.grid:
+            self.reference.append([
+                ax.axvline(x=0, linewidth=1, color='black'),
+                ax.axhline(y=0, linewidth=1, color='black')])
+            self.positions.append([
+                ax.axvline(x=0, linewidth=1, color='black', ls='dashed'),
+                ax.axhline(y=0, linewidth=1, color='black', ls='dashed')])
+
+    def update(self, comparison, axis):
+        difference = comparison['difference'][0]
+        limit = max(np.max(np.abs(difference)), 1)
+
+        for k in range(NROWS * NCOLS):
+            xs = comparison['xs'][k].astype(np.float32)
+            ys = comparison['ys'][k].astype(np.float32)
+            self.update_image(k, difference[k], xs, ys)
+            self.images[k].set_clim(-limit, limit)
+            vline, hline = self.reference[k]
+            vline.set_xdata([comparison['referencePositionX'][k]] * 2)
+            hline.set_ydata([comparison['referencePositionY'][k]] * 2)
+            vline, hline = self.positions[k]
+            vline.set_xdata([comparison['positionX'][0, k]] * 2)
+            hline.set_ydata([comparison['positionY'][0, k]] * 2)
+            self.grid[k].title.set_text(
+                "%g" % comparison['ActualPositionY'][k]
+                + ',' + "%g" % comparison['ActualPositionX'][k] + ':'
+                + "%+.1f%%" % (comparison['deltaSpotSizeX'][0, k] /
+                               comparison['referenceSpotSizeX'][k] * 100))
+
+
+TEMPLATES = {
+    ('profile', 'position'): ProfilePositionTemplate,
+    ('profile', 'size'): ProfileSizeTemplate,
+    ('spot', 'position'): SpotPositionTemplate,
+    ('spot', 'size'): SpotSizeTemplate,
+    ('comparison', 'overlay'): OverlayTemplate,
+    ('comparison', 'difference'): DifferenceTemplate,
+}
+
+
+def get_template(plot_type, annotations):
+    """Return the figure template of this process for the plot type."""
+
+    key = (plot_type, annotations)
+    with _lock:
+        if key not in _templates:
+            _templates[key] = TEMPLATES[key]()
+        return _templates[key]
+
+
+def render_png(spotdata, plot_type='profile', annotations='position',
+               axis='x'):
+    """Render the requested plot of the spot data as PNG data.
+
+       spotdata: dictionary of spot properties, or the result of
+                 compare.compare_files for comparison plots
+       plot_type: string representing plot type ('profile', 'spot',
+                  'comparison')
+       annotations: string respresenting annotations to show on plot
+                    ('position', 'size', or for comparisons 'overlay',
+                    'difference')
+       axis: string representing line profile axis ('x', 'y')
+    """
+
+    return get_template(plot_type, annotations).render(spotdata, axis)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# reftables.py
+"""Versioned reference values of the spots of each unit and phantom."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import re
+import hashlib
+import threading
+from bisect import bisect_right
+from math import sqrt, log
+
+import numpy as np
+from django.conf import settings
+
+import roi
+
+# Conversion from the standard deviation of a Gaussian to its FWHM
+FWHM_SIGMA = 2 * sqrt(2 * log(2))
+
+# Layout of the spots of the phantom with their expected FWHM (mm) and the
+# corresponding standard deviation (mm) along each axis
+REFERENCE_DTYPE = roi.SPOT_DTYPE + [('fwhmX', float), ('fwhmY', float),
+                                    ('sigmaX', float), ('sigmaY', float)]
+
+# Spot layout of each phantom
+PHANTOMS = {'default': roi.SPOT_LAYOUT}
+
+# Commissioning FWHM (mm) of the spots of the default phantom, in the
+# order of its layout
+DEFAULT_FWHM_X = [
+    10.9356585577624, 13.8930985922848, 12.301982918428, 16.5682702861368,
+    15.5336685559552, 10.0079, 17.661, 9.9388035886888,
+    12.301982918428, 16.5682702861368, 10.9356585577624, 13.8930985922848,
+    17.661, 9.9388035886888, 15.5336685559552, 10.0079]
+DEFAULT_FWHM_Y = [
+    11.1247051608056, 14.0175810440288, 12.4253703811076, 17.0572244550148,
+    15.8049030455876, 10.12564, 18.36744, 9.9363231954308,
+    12.4253703811076, 17.0572244550148, 11.1247051608056, 14.0175810440288,
+    18.36744, 9.9363231954308, 15.8049030455876, 10.12564]
+
+# Column of the reference values of each trended analysis result
+EXPECTED = {'positionX': 'x', 'positionY': 'y',
+            'SpotSizeX': 'fwhmX', 'SpotSizeY': 'fwhmY'}
+
+# Pixel spacing (cm) of the exported dose planes
+PIXEL_SPACING = 0.1
+
+# Spot position pass and tolerance limits (cm) from the expected position
+POSITION_TOLERANCE = (0.2, 0.5)
+
+# Spot size pass and tolerance limits relative to the expected FWHM
+SIZE_TOLERANCE = (0.1, 0.2)
+
+# Flatness and symmetry (%) pass and tolerance limits of every region.
+# There are no clinical limits of these for the spot phantom, so they are
+# left unclassified unless a reference table gives its own limits.
+FLATNESS_TOLERANCE = None
+SYMMETRY_TOLERANCE = None
+
+
+def make_spots(layout, fwhmX, fwhmY):
+    """Return the reference values of the spots of the phantom layout with
+       the given expected FWHM (mm) of each spot."""
+
+    spots = np.zeros(len(layout), dtype=REFERENCE_DTYPE)
+    for name in layout.dtype.names:
+        spots[name] = layout[name]
+    spots['fwhmX'] = fwhmX
+    spots['fwhmY'] = fwhmY
+    spots['sigmaX'] = spots['fwhmX'] / FWHM_SIGMA
+    spots['sigmaY'] = spots['fwhmY'] / FWHM_SIGMA
+    return spots
+
+
+def _limits(tolerance):
+    """Return the (pass, tolerance) limits as floats, or None if there are
+       no limits."""
+    return None if tolerance is None else tuple(float(t) for t in tolerance)
+
+
+class Reference(object):
+    """Reference values that the analysis of a spot file is compared to.
+
+       name: name of the table
+       spots: structured array of REFERENCE_DTYPE with a row for each spot
+       position_tolerance: (pass, tolerance) limits of the position (cm)
+       size_tolerance: (pass, tolerance) limits of the size relative to the
+                       expected FWHM
+       flatness_tolerance, symmetry_tolerance: (pass, tolerance) limits of
+                       the flatness and symmetry (%) of each region, or
+                       None if they are not classified
+       spacing: expected pixel spacing (cm) of the spot files
+
+       The key combines the name with a digest of the values, so results
+       cached for a table are not reused once its values are changed."""
+
+    def __init__(self, name, spots, position_tolerance=POSITION_TOLERANCE,
+                 size_tolerance=SIZE_TOLERANCE,
+                 flatness_tolerance=FLATNESS_TOLERANCE,
+                 symmetry_tolerance=SYMMETRY_TOLERANCE,
+                 spacing=PIXEL_SPACING):
+        self.name = name
+        self.spots = spots
+        self.position_tolerance = _limits(position_tolerance)
+        self.size_tolerance = _limits(size_tolerance)
+        self.flatness_tolerance = _limits(flatness_tolerance)
+        self.symmetry_tolerance = _limits(symmetry_tolerance)
+        self.spacing = float(spacing)
+        h = hashlib.sha1(spots.tobytes())
+        h.update(repr((self.position_tolerance, self.size_tolerance,
+                       self.flatness_tolerance, self.symmetry_tolerance,
+                       self.spacing)).encode('ascii'))
+        self.key = name + '-' + h.hexdigest()[:8]
+
+    def __str__(self):
+        return self.key
+
+
+DEFAULT = Reference(
+    'default',
+    make_spots(PHANTOMS['default'], DEFAULT_FWHM_X, DEFAULT_FWHM_Y))
+
+_lock = threading.Lock()
+_index = None
+_lookups = {}
+
+
+def build_index(tables):
+    """Index the reference tables given in the settings.
+
+       tables: list of dicts with the name of the table, the unit id, the
+               date (YYYY-MM-DD) from which it applies, the expected fwhmX
+               and fwhmY (mm) of every spot and optionally the phantom, the
+               position, size, flatness and symmetry tolerances and the
+               pixel spacing (cm)
+
+       Returns a dict of the (dates, references) of each unit sorted by
+       date, and a dict of every reference by its key."""
+
+    units = {}
+    keys = {DEFAULT.key: DEFAULT}
+    for table in tables:
+        # The key of the table is part of the URLs of the rendered plots
+        if not re.match(r'^[\w.]+$', table['name']):
+            raise ValueError("Invalid reference table name: " + table['name'])
+        layout = PHANTOMS[table.get('phantom', 'default')]
+        reference = Reference(
+            table['name'],
+            make_spots(layout, table['fwhmX'], table['fwhmY']),
+            table.get('position_tolerance', POSITION_TOLERANCE),
+            table.get('size_tolerance', SIZE_TOLERANCE),
+            table.get('flatness_tolerance', FLATNESS_TOLERANCE),
+            table.get('symmetry_tolerance', SYMMETRY_TOLERANCE),
+            table.get('spacing', PIXEL_SPACING))
+        units.setdefault(table['unit'], []).append(
+            (table.get('from', ''), reference))
+        keys[reference.key] = reference
+
+    for unit, entries in units.items():
+        entries.sort(key=lambda e: e[0])
+        units[unit] = ([e[0] for e in entries], [e[1] for e in entries])
+    return units, keys
+
+
+def get_index():
+    """Return the index of the reference tables, built once per process."""
+
+    global _index
+    with _lock:
+        if _index is None:
+            _index = build_index(
+                getattr(settings, 'PBS_DAILY_QA_REFERENCES', []))
+        return _index
+
+
+def get_reference(unit=None, date=None):
+    """Return the reference table that applies to the unit on the date
+       (YYYY-MM-DD), or the default table if there is none.
+
+       Lookups are remembered, so a repeated lookup is a single dict access.
+    """
+
+    key = (unit, str(date) if date is not None else None)
+    reference = _lookups.get(key)
+    if reference is None:
+        units, keys = get_index()
+        dates, references = units.get(unit, ([], []))
+        i = len(dates) if date is None else bisect_right(dates, key[1])
+        reference = references[i - 1] if i else DEFAULT
+        _lookups[key] = reference
+    return reference
+
+
+def by_key(key):
+    """Return the reference table with the given key, or None."""
+    return get_index()[1].get(key)
+
+
+def spot_names():
+    """Return the names of the spots of every reference table, those of the
+       default table first."""
+
+    names = DEFAULT.spots['name'].tolist()
+    for reference in get_index()[1].values():
+        names += [n for n in reference.spots['name'].tolist()
+                  if n not in names]
+    return names
+
+
+def expected_values(key, spot):
+    """Return the expected positionX/Y (cm) and SpotSizeX/Y (mm) of the
+       named spot in the reference table with the given key, or None if the
+       table or the spot is unknown."""
+
+    reference = by_key(key)
+    if reference is None:
+        return None
+    k = np.flatnonzero(reference.spots['name'] == spot)
+    if not len(k):
+        return None
+    return dict((v, float(reference.spots[c][k[0]]))
+                for v, c in EXPECTED.items())
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# render.py
+"""Render the PBS Daily QA plots ahead of time into a render cache."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+
+from django.conf import settings
+
+import analysis
+import cache
+import compare
+import opg
+import reftables
+import results
+import singleflight
+import timing
+
+# Increment when a change to the plots alters the rendered images
+RENDER_VERSION = 5
+
+# Versions of the analysis and plots that a rendered image depends on
+VERSION_TAG = 'v%dr%d' % (analysis.ANALYSIS_VERSION, RENDER_VERSION)
+
+# Number of worker processes used to pre-render plots
+RENDER_PROCESSES = getattr(settings, 'PBS_DAILY_QA_RENDER_PROCESSES', 2)
+
+# Seconds to wait for an uploaded file to be moved into UPLOAD_ROOT
+RENDER_WAIT = getattr(settings, 'PBS_DAILY_QA_RENDER_WAIT', 10)
+
+# Seconds a request waits for a plot to be rendered before it is asked to
+# retry the request later
+RENDER_TIMEOUT = getattr(settings, 'PBS_DAILY_QA_RENDER_TIMEOUT', 2.0)
+
+# Largest number of plots waiting to be rendered for requests in each
+# process; further requests are asked to retry later
+RENDER_QUEUE = getattr(settings, 'PBS_DAILY_QA_RENDER_QUEUE',
+                       4 * RENDER_PROCESSES)
+
+# Seconds the client is asked to wait before retrying a request
+RETRY_AFTER = 1
+
+PLOT_TYPES = ['profile', 'spot']
+ANNOTATIONS = ['position', 'size']
+AXES = ['x', 'y']
+
+_lock = threading.Lock()
+_pool = None
+_jobs = {}
+
+
+def variant(plot_type, annotations, axis):
+    """Return the plot parameters that produce a distinct image.
+
+       Spot plots show both axes, so they do not depend on the axis."""
+
+    return plot_type, annotations, axis if plot_type == 'profile' else 'x'
+
+
+def variants():
+    """Return every distinct plot variant."""
+
+    return sorted(set(variant(p, a, x) for p in PLOT_TYPES
+                      for a in ANNOTATIONS for x in AXES))
+
+
+def render_path(sha, plot_type, annotations, axis,
+                reference=reftables.DEFAULT):
+    """Path of the rendered plot for the spot file with the given hash,
+       analysed with the given reference table."""
+
+    key = '_'.join([cache.cache_key(sha, reference=reference),
+                    'r' + str(RENDER_VERSION)] +
+                   list(variant(plot_type, annotations, axis)))
+    return os.path.join(cache.CACHE_ROOT, 'renders', key[:2], key + '.png')
+
+
+def render_png(spotdata, plot_type, annotations, axis):
+    """Render the requested plot of the spot data as PNG data."""
+
+    # matplotlib takes most of the import time of the app, so only load it
+    # in the processes that render plots
+    import plots
+    return plots.render_png(
+        spotdata,
+        plot_type=plot_type,
+        annotations=annotations,
+        axis=axis)
+
+
+def write_png(path, png):
+    """Write the PNG data to the render cache."""
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(png)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        os.remove(tmp)
+
+
+def render_file(filename, record=None):
+    """Analyse the spot file once and render every plot variant of it.
+
+       record: optional (TestListInstance id, unit id, date) used to add the
+       results of the file to the results table."""
+
+    # The upload may not have been moved into place when the test
+    # instance is saved, so wait for a little while for it to appear
+    end = time.time() + RENDER_WAIT
+    while not os.path.exists(filename):
+        if time.time() > end:
+            return
+        time.sleep(0.5)
+
+    sha = cache.file_hash(filename)
+    reference = reftables.get_reference(*record[1:]) if record else \
+        reftables.DEFAULT
+    date = opg.file_date(record[2]) if record else None
+    spots, spotdata = cache.read_file(
+        filename, date=date, reference=reference)
+    if record is not None:
+        results.append_rows(results.spot_rows(*(record + (sha, spotdata))))
+    for params in variants():
+        render_plot(render_path(sha, *params, reference=reference), sha,
+                    *params, reference=reference)
+
+
+def _get_pool_locked():
+    """Return the process pool, creating it on first use, with the lock
+       held."""
+
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(RENDER_PROCESSES)
+    return _pool
+
+
+def _get_pool():
+    """Return the process pool, creating it on first use."""
+
+    with _lock:
+        return _get_pool_locked()
+
+
+def submit(filename, record=None):
+    """Pre-render every plot of the spot file in the process pool."""
+
+    return _get_pool().apply_async(render_file, (filename, record))
+
+
+def render_plot(path, sha, plot_type, annotations, axis,
+                reference=reftables.DEFAULT, filename=None, date=None):
+    """Render a single plot into the render cache, analysing the spot file
+       first if its analysis is not cached. The file is checked against the
+       expected date (YYYYMMDD) in its file name, if any.
+
+       Returns False if there is no analysis and no file to analyse."""
+
+    def rendered():
+        return True if os.path.exists(path) else None
+
+    def render():
+        if filename is None:
+            spotdata = cache.lookup(sha, reference=reference)
+            if spotdata is None:
+                return False
+        else:
+            spots, spotdata = cache.read_file(
+                filename, date=date, reference=reference)
+        write_png(path, render_png(spotdata, plot_type, annotations, axis))
+        return True
+
+    # The plot is rendered once for the concurrent requests of every
+    # process, e.g. a request and the pre-rendering of an upload
+    return singleflight.run(path, path + '.lock', rendered, render)
+
+
+def _finish(job, request=True):
+    """Return the result of the finished job and record the stages timed in
+       the pool process in the metrics of this process.
+
+       Raises the exception of the job if it failed."""
+
+    result, stages, rss = job.get()
+    timing.merge(stages, rss, request)
+    return result
+
+
+def _request(path, func, args, timeout):
+    """Return the path and status of the image, running func(*args) in the
+       process pool to render it if it does not exist, as request_plot
+       does. Concurrent requests for the same path share a single job."""
+
+    if os.path.exists(path):
+        return path, 'done'
+
+    finished = []
+    with _lock:
+        job = _jobs.get(path)
+        if job is None:
+            # Forget the finished jobs of requests that did not wait for them
+            for key in [k for k, j in _jobs.items() if j.ready()]:
+                finished.append(_jobs.pop(key))
+            if len(_jobs) < RENDER_QUEUE:
+                job = _jobs[path] = _get_pool_locked().apply_async(
+                    timing.collect, (func,) + tuple(args))
+    # Their stages are still recorded in the metrics, but not as stages of
+    # this request
+    for j in finished:
+        try:
+            _finish(j, request=False)
+        except Exception:
+            pass
+    if job is None:
+        return path, 'busy'
+
+    job.wait(timeout)
+    if not job.ready():
+        return path, 'pending'
+
+    # The stages of the job are recorded once, by the request that removes
+    # the job, and the exception of the job is raised if the render failed
+    with _lock:
+        owner = _jobs.get(path) is job
+        if owner:
+            del _jobs[path]
+    result = _finish(job) if owner else job.get()[0]
+    return path, 'done' if result else 'missing'
+
+
+def check_date(sha, filename, date, reference=reftables.DEFAULT):
+    """Check the date (YYYYMMDD) in the name of the exported spot file
+       before any rendered plot of it is served, e.g. when the file is
+       uploaded again to a test of another day.
+
+       The file name is taken from the cached analysis, or from the header
+       of the file if it has not been analysed. Raises ValueError if the
+       date does not match."""
+
+    spotdata = cache.lookup(sha, reference=reference)
+    if spotdata is not None:
+        opg.validate_date(spotdata['FileName'], date)
+    else:
+        with open(filename, 'r') as f:
+            opg.validate_date(opg.read_header(f).get('File Name', ''), date)
+
+
+def request_plot(sha, plot_type, annotations, axis,
+                 reference=reftables.DEFAULT, filename=None, date=None,
+                 timeout=RENDER_TIMEOUT):
+    """Return the path of the rendered plot, rendering it in the process
+       pool if it is not in the render cache.
+
+       Concurrent requests for the same plot share a single render job.
+       Waits up to timeout seconds for the job and returns the path and the
+       status of the plot: 'done', 'pending' if it is still being rendered,
+       'busy' if too many plots are waiting to be rendered, or 'missing' if
+       there is no analysis of the file with the given hash.
+
+       Raises ValueError if the file fails validation against the reference
+       table or the expected date (YYYYMMDD) in its file name."""
+
+    if filename is not None and date is not None:
+        check_date(sha, filename, date, reference)
+    path = render_path(sha, plot_type, annotations, axis, reference)
+    return _request(path, render_plot, (
+        path, sha, plot_type, annotations, axis, reference, filename, date),
+        timeout)
+
+
+def comparison_path(shas, reference_shas, annotations, axis):
+    """Path of the rendered comparison of the spot files with the given
+       hashes against the reference files with the given hashes."""
+
+    h = hashlib.sha1(' '.join(shas + ['-'] + reference_shas).encode('ascii'))
+    key = '_'.join([h.hexdigest(), VERSION_TAG, 'comparison', annotations,
+                    axis])
+    return os.path.join(cache.CACHE_ROOT, 'renders', 'comparisons', key[:2],
+                        key + '.png')
+
+
+def render_comparison(path, filenames, references, annotations, axis):
+    """Compare the spot files against the reference files and render the
+       comparison plot into the render cache."""
+
+    def rendered():
+        return True if os.path.exists(path) else None
+
+    def render():
+        comparison = compare.compare_files(filenames, references)
+        write_png(path, render_png(comparison, 'comparison', annotations,
+                                   axis))
+        return True
+
+    return singleflight.run(path, path + '.lock', rendered, render)
+
+
+def request_comparison(filenames, references, annotations, axis,
+                       timeout=RENDER_TIMEOUT):
+    """Return the path and status of the rendered comparison of the spot
+       files against the reference files, rendering it in the process pool
+       as request_plot does.
+
+       Raises ValueError if the files are not on the same grid."""
+
+    path = comparison_path([cache.file_hash(f) for f in filenames],
+                           [cache.file_hash(f) for f in references],
+                           annotations, axis)
+    return _request(path, render_comparison, (
+        path, filenames, references, annotations, axis), timeout)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# results.py
+"""Store the analysis results of every spot file as a table of spots."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import csv
+import sys
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
+import numpy as np
+from django.conf import settings
+
+import analysis
+import cache
+import flatsym
+import opg
+import reftables
+
+# CSV file holding one row per analysed spot file and spot
+RESULTS_PATH = getattr(settings, 'PBS_DAILY_QA_RESULTS_PATH',
+                       os.path.join(cache.CACHE_ROOT, 'results.csv'))
+
+# Columns that identify the spot file a row belongs to
+FILE_COLUMNS = ['tli', 'unit', 'date', 'sha', 'version', 'reference']
+
+# Spot data values stored for each spot
+SPOT_COLUMNS = ['positionX', 'positionY', 'SpotSizeX', 'SpotSizeY',
+                'sigmaX', 'sigmaY', 'ActualPositionX', 'ActualPositionY',
+                'ActualFWHMX', 'ActualFWHMY', 'ActualEnergy']
+
+# Spot data values of the whole file repeated on each row, with the flatness
+# and symmetry of each of the regions
+FILE_VALUES = [m + str(name) for m in flatsym.METRICS
+               for name in flatsym.REGIONS['name']] + ['Background']
+
+COLUMNS = FILE_COLUMNS + ['spot'] + SPOT_COLUMNS + FILE_VALUES
+
+
+def _open(path, mode):
+    """Open the CSV file in the mode the csv module expects."""
+
+    if sys.version_info[0] < 3:
+        return open(path, mode + 'b')
+    return open(path, mode, newline='')
+
+
+def spot_rows(tli, unit, date, sha, spotdata):
+    """Return the table rows of the analysed spot file, named after the
+       spots of the reference table it was analysed with."""
+
+    reference = reftables.by_key(spotdata['Reference']) or reftables.DEFAULT
+    file_values = [spotdata[k] for k in FILE_VALUES]
+    rows = []
+    for k, name in enumerate(reference.spots['name']):
+        rows.append([tli, unit, date, sha, analysis.ANALYSIS_VERSION,
+                     spotdata['Reference'], name] +
+                    [spotdata[c][k] for c in SPOT_COLUMNS] + file_values)
+    return rows
+
+
+def analyse(job):
+    """Analyse a single spot file of the archive.
+
+       job: (TestListInstance id, unit id, date, file name)
+
+       Returns the id of the TestListInstance, the table rows and an error
+       message if the file could not be analysed."""
+
+    tli, unit, date, filename = job
+    try:
+        sha = cache.file_hash(filename)
+        spots, spotdata = analysis.read_file(
+            filename, reftables.get_reference(unit, date),
+            date=opg.file_date(date))
+    except (IOError, OSError, ValueError, KeyError, IndexError) as e:
+        return tli, [], str(e)
+    return tli, spot_rows(tli, unit, date, sha, spotdata), None
+
+
+def read_header(path=RESULTS_PATH):
+    """Return the columns of the results table, or None if it is missing."""
+
+    if not os.path.exists(path):
+        return None
+    with _open(path, 'r') as f:
+        return next(csv.reader(f), None)
+
+
+def read_rows(path=RESULTS_PATH):
+    """Read the rows of the results table as dicts.
+
+       A table with different columns holds the results of an older version
+       of the analysis, so no rows are returned for it."""
+
+    if read_header(path) != COLUMNS:
+        return []
+    with _open(path, 'r') as f:
+        return list(csv.DictReader(f))
+
+
+def read_columns(path=RESULTS_PATH):
+    """Read the results table as a dict of columns of strings."""
+
+    if read_header(path) != COLUMNS:
+        return dict((c, np.zeros(0, dtype=str)) for c in COLUMNS)
+    with _open(path, 'r') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        data = np.array(list(reader), dtype=str).reshape(-1, len(header))
+    return dict((c, data[:, i]) for i, c in enumerate(header))
+
+
+def processed(rows, version=analysis.ANALYSIS_VERSION):
+    """Return the ids of the TestListInstances analysed by the given
+       version of the analysis."""
+
+    return set(int(r['tli']) for r in rows if int(r['version']) == version)
+
+
+@contextmanager
+def locked(path=RESULTS_PATH):
+    """Hold an exclusive lock of the results table while it is written.
+
+       The lock is held on a separate lock file, as the table itself is
+       replaced when it is rewritten, and is released if the process dies.
+    """
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by another process in the meantime
+            pass
+    with open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _write_rows(rows, path):
+    """Replace the results table with the given rows, with the lock held."""
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               suffix='.tmp')
+    os.close(fd)
+    with _open(tmp, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for r in rows:
+            writer.writerow([r[c] for c in COLUMNS])
+    os.rename(tmp, path)
+
+
+def write_rows(rows, path=RESULTS_PATH):
+    """Replace the results table with the given rows (as dicts)."""
+
+    with locked(path):
+        _write_rows(rows, path)
+
+
+def keep_rows(keep, path=RESULTS_PATH):
+    """Remove the rows (as dicts) for which keep(row) is false from the
+       results table and return the remaining rows.
+
+       The table is read and rewritten with the lock held, so rows appended
+       by other processes in the meantime are not lost."""
+
+    with locked(path):
+        rows = read_rows(path)
+        kept = [r for r in rows if keep(r)]
+        if len(kept) != len(rows):
+            _write_rows(kept, path)
+    return kept
+
+
+def append_rows(rows, path=RESULTS_PATH):
+    """Append the rows (as lists) to the results table.
+
+       The lock is held while the rows are written, so rows appended by
+       several processes are not interleaved."""
+
+    with locked(path):
+        # Start a new table if the columns have changed
+        new = read_header(path) != COLUMNS
+        with _open(path, 'w' if new else 'a') as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(COLUMNS)
+            writer.writerows(rows)
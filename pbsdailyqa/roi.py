@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# roi.py
+"""Extract the spot regions of interest from a planar dose grid."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Layout of a spot in the phantom: centre (cm), half width of the ROI (cm)
+# and the energy layer (range in cm) that the spot was delivered with
+SPOT_DTYPE = [('name', 'U8'), ('y', float), ('x', float),
+              ('halfwidth', float), ('energy', int)]
+
+# Spots are listed row by row (inplane) from the top left of the image
+SPOT_LAYOUT = np.array([
+    ('1A', -8.0, -8.0, 2.0, 8), ('2A', -8.0, -4.2, 2.0, 30),
+    ('5A', -8.0, 4.2, 2.0, 12), ('6A', -8.0, 8.0, 2.0, 25),
+    ('3A', -4.2, -8.0, 2.0, 18), ('4A', -4.2, -4.2, 2.0, 10),
+    ('7A', -4.2, 4.2, 2.0, 21), ('8A', -4.2, 8.0, 2.0, 15),
+    ('5B', 4.2, -8.0, 2.0, 12), ('6B', 4.2, -4.2, 2.0, 25),
+    ('1B', 4.2, 4.2, 2.0, 8), ('2B', 4.2, 8.0, 2.0, 30),
+    ('7B', 8.0, -8.0, 2.0, 21), ('8B', 8.0, -4.2, 2.0, 15),
+    ('3B', 8.0, 4.2, 2.0, 18), ('4B', 8.0, 8.0, 2.0, 10)],
+    dtype=SPOT_DTYPE)
+
+
+def _tolerance(coords):
+    """Tolerance used to match coordinates read from a file."""
+    return 1e-3 * np.min(np.abs(np.diff(coords)))
+
+
+def coordinate_slice(coords, start, stop):
+    """Return the slice of the ascending coordinates that lie within
+       [start, stop] inclusive, matching label based slicing."""
+
+    tol = _tolerance(coords)
+    return slice(np.searchsorted(coords, start - tol),
+                 np.searchsorted(coords, stop + tol, side='right'))
+
+
+def coordinate_index(coords, value):
+    """Return the index of the given coordinate value."""
+
+    i = np.searchsorted(coords, value - _tolerance(coords))
+    if i == len(coords) or abs(coords[i] - value) > _tolerance(coords):
+        raise KeyError(value)
+    return i
+
+
+def _windows(coords, centres, halfwidths):
+    """Return the start indices and the common length of the inclusive
+       windows centre +/- halfwidth along the given coordinates."""
+
+    tol = _tolerance(coords)
+    starts = np.searchsorted(coords, centres - halfwidths - tol)
+    stops = np.searchsorted(coords, centres + halfwidths + tol, side='right')
+    lengths = np.unique(stops - starts)
+    if len(lengths) != 1:
+        raise ValueError("Spot ROIs do not have a uniform size on the grid")
+    return starts, lengths[0]
+
+
+def extract_rois(grid, layout=SPOT_LAYOUT):
+    """Extract every spot ROI of the layout from the dose grid.
+
+       Returns a stacked (n, h, w) array of the ROIs along with the
+       (n, h) row and (n, w) column coordinates of each ROI."""
+
+    rows, h = _windows(grid.y, layout['y'], layout['halfwidth'])
+    cols, w = _windows(grid.x, layout['x'], layout['halfwidth'])
+
+    # View every (h, w) window of the dose grid without copying and
+    # gather the windows at each spot in a single indexing operation
+    dose = grid.dose
+    nrows, ncols = dose.shape
+    windows = as_strided(
+        dose, shape=(nrows - h + 1, ncols - w + 1, h, w),
+        strides=dose.strides * 2)
+    rois = windows[rows, cols]
+
+    ys = grid.y[rows[:, np.newaxis] + np.arange(h)]
+    xs = grid.x[cols[:, np.newaxis] + np.arange(w)]
+    return rois, ys, xs
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# serializers.py
+"""Convert the PBS daily QA analysis into JSON serializable data."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import base64
+
+import numpy as np
+
+import compare
+import verdicts
+
+
+def encode_array(a):
+    """Encode an array as base64 little endian float32 data."""
+
+    a = np.ascontiguousarray(a, dtype='<f4')
+    return {'dtype': 'float32',
+            'shape': list(a.shape),
+            'data': base64.b64encode(a.tobytes()).decode('ascii')}
+
+
+def tolist(a):
+    """Return the value as a (nested) list of python numbers."""
+    return np.asarray(a).tolist()
+
+
+def spot_summary(spotdata):
+    """Return the numeric results of the analysis of every spot."""
+
+    summary = {
+        'positionX': tolist(spotdata['positionX']),
+        'positionY': tolist(spotdata['positionY']),
+        'SpotSizeX': tolist(spotdata['SpotSizeX']),
+        'SpotSizeY': tolist(spotdata['SpotSizeY']),
+        'sigmaX': tolist(spotdata['sigmaX']),
+        'sigmaY': tolist(spotdata['sigmaY']),
+        'Background': float(spotdata['Background']),
+        'ActualPositionX': tolist(spotdata['ActualPositionX']),
+        'ActualPositionY': tolist(spotdata['ActualPositionY']),
+        'ActualFWHMX': tolist(spotdata['ActualFWHMX']),
+        'ActualFWHMY': tolist(spotdata['ActualFWHMY']),
+        'ActualSigmaX': tolist(spotdata['ActualSigmaX']),
+        'ActualSigmaY': tolist(spotdata['ActualSigmaY']),
+        'ActualEnergy': tolist(spotdata['ActualEnergy']),
+        'Reference': str(spotdata['Reference']),
+    }
+    summary['verdicts'] = verdicts.spot_verdicts(spotdata)
+    # Include the flatness and symmetry of every region, the results of
+    # the Gaussian fit if it was performed and the local background
+    for k in spotdata:
+        if k.startswith(('flatness', 'symmetry', 'pointSymmetry', 'fit',
+                         'SpotBackground')):
+            summary[k] = tolist(spotdata[k])
+    return summary
+
+
+def spot_payload(spotdata):
+    """Return everything needed to plot the analysis in the browser."""
+
+    payload = spot_summary(spotdata)
+    payload.update({
+        'Halfmax': tolist(spotdata['Halfmax']),
+        'fwhmX': tolist(spotdata['fwhmX']),
+        'fwhmY': tolist(spotdata['fwhmY']),
+        'x': encode_array(spotdata['x']),
+        'y': encode_array(spotdata['y']),
+        'xs': encode_array(spotdata['xs']),
+        'ys': encode_array(spotdata['ys']),
+        'spots': encode_array(spotdata['spots']),
+        'tolerances': {
+            'position': tolist(spotdata['PositionTolerance']),
+            'size': tolist(spotdata['SizeTolerance']),
+            'flatness': tolist(spotdata.get('FlatnessTolerance')),
+            'symmetry': tolist(spotdata.get('SymmetryTolerance'))},
+    })
+    return payload
+
+
+def comparison_summary(comparison):
+    """Return the numeric results of a comparison of spot files."""
+
+    summary = {}
+    for k in compare.VALUES:
+        for name in (k, compare.key('reference', k), compare.key('delta', k)):
+            summary[name] = tolist(comparison[name])
+    return summary
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# sidecar.py
+"""Binary sidecar files of OPG dose planes that are memory-mapped on read."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import json
+import struct
+import tempfile
+
+import numpy as np
+
+import opg
+
+# Extension appended to the name of the OPG file for its sidecar
+EXTENSION = '.dose'
+
+# Identifies a sidecar file and the version of its layout
+MAGIC = b'PBSDOSE1'
+
+# Offset of each array in the file is a multiple of this
+ALIGNMENT = 64
+
+
+def sidecar_path(filename):
+    """Path of the sidecar of the OPG file."""
+    return filename + EXTENSION
+
+
+def _source(filename):
+    """Size and modification time of the OPG file the sidecar belongs to."""
+
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime]
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_sidecar(path, grid, source):
+    """Write the dose grid to the sidecar file.
+
+       Layout: magic, little endian uint32 length of the JSON metadata, the
+       metadata, then the float64 x and y coordinates and the float32 dose
+       matrix, each aligned to ALIGNMENT bytes."""
+
+    nrows, ncols = grid.dose.shape
+    arrays = [np.ascontiguousarray(grid.x, dtype='<f8'),
+              np.ascontiguousarray(grid.y, dtype='<f8'),
+              np.ascontiguousarray(grid.dose, dtype='<f4')]
+
+    # Lay out the arrays after the metadata, whose size depends on offsets
+    meta = {'shape': [nrows, ncols], 'header': grid.header,
+            'source': source, 'offsets': [0, 0, 0]}
+    while True:
+        metadata = json.dumps(meta, sort_keys=True).encode('utf-8')
+        offset = _align(len(MAGIC) + 4 + len(metadata))
+        offsets = []
+        for a in arrays:
+            offsets.append(offset)
+            offset = _align(offset + a.nbytes)
+        if offsets == meta['offsets']:
+            break
+        meta['offsets'] = offsets
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(metadata)) + metadata)
+        for a, o in zip(arrays, offsets):
+            f.write(b'\0' * (o - f.tell()))
+            f.write(a.tobytes())
+    os.chmod(tmp, 0o644)
+    os.rename(tmp, path)
+
+
+def read_sidecar(path, source=None):
+    """Memory-map the sidecar file as a DoseGrid.
+
+       Raises ValueError if the file is not a sidecar or was written for a
+       different version (size and modification time) of the OPG file."""
+
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a dose sidecar file: " + path)
+        length, = struct.unpack('<I', f.read(4))
+        meta = json.loads(f.read(length).decode('utf-8'))
+    if source is not None and meta['source'] != source:
+        raise ValueError("Outdated dose sidecar file: " + path)
+
+    nrows, ncols = meta['shape']
+    x, y, dose = [
+        np.memmap(path, dtype=dtype, mode='r', offset=o, shape=shape)
+        for dtype, o, shape in zip(
+            ['<f8', '<f8', '<f4'], meta['offsets'],
+            [(ncols,), (nrows,), (nrows, ncols)])]
+    return opg.DoseGrid(dose, x, y, meta['header'])
+
+
+def read_grid(filename, date=None, spacing=None):
+    """Return the DoseGrid of the OPG file from its sidecar, writing the
+       sidecar from the OPG file first if it is missing or outdated.
+
+       The file is validated against the optional date (YYYYMMDD) and pixel
+       spacing (cm) as opg.read_opg does, whether or not the sidecar could
+       be used. The dose is float32 in either case."""
+
+    path = sidecar_path(filename)
+    source = _source(filename)
+    try:
+        grid = read_sidecar(path, source)
+    except (IOError, OSError, ValueError, KeyError):
+        grid = None
+    if grid is not None:
+        opg.validate_grid(grid, date, spacing)
+        return grid
+
+    grid = opg.read_opg(filename, date, spacing)
+    grid.dose = grid.dose.astype(np.float32)
+    try:
+        write_sidecar(path, grid, source)
+    except (IOError, OSError):
+        # The upload directory may not be writable
+        pass
+    return grid
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# signals.py
+"""Signal handlers for the PBS Daily QA app."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from qatrack.qa import models
+from qatrack.units import models as unitmodels
+from tzlocal import get_localzone
+
+import render
+import units
+
+dtformat = "%Y-%m-%d"
+
+
+@receiver(post_save, sender=models.TestInstance)
+def prerender_spot_file(sender, instance, **kwargs):
+    """Pre-render the plots when a spot position file is uploaded."""
+
+    # Test instances are saved again when they are reviewed or edited, which
+    # does not upload a new file
+    if not kwargs.get('created'):
+        return
+
+    # Only upload tests have a file name stored as their string value
+    if not instance.string_value:
+        return
+
+    unit = models.UnitTestInfo.objects.filter(
+        pk=instance.unit_test_info_id,
+        test_id=settings.PBS_DAILY_QA_SPOTFILE_TEST_ID
+    ).values_list('unit_id', flat=True)
+
+    if unit:
+        # Also add the results of the file to the results table
+        date = instance.work_completed.astimezone(
+            get_localzone()).strftime(dtformat)
+        render.submit(os.path.join(
+            settings.UPLOAD_ROOT, str(instance.test_list_instance_id),
+            instance.string_value),
+            (instance.test_list_instance_id, unit[0], date))
+
+
+@receiver(post_save, sender=models.UnitTestCollection)
+@receiver(post_delete, sender=models.UnitTestCollection)
+@receiver(post_save, sender=models.UnitTestInfo)
+@receiver(post_delete, sender=models.UnitTestInfo)
+@receiver(post_save, sender=unitmodels.Unit)
+@receiver(post_delete, sender=unitmodels.Unit)
+def invalidate_unitlist(sender, **kwargs):
+    """Rebuild the unit list when the configuration of the units changes."""
+    units.invalidate()
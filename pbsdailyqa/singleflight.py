@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# singleflight.py
+"""Compute a result once for concurrent identical requests."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import time
+import errno
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
+from django.conf import settings
+
+import timing
+
+# Seconds a process waits for another process to compute a result before
+# it computes the result itself
+LOCK_TIMEOUT = getattr(settings, 'PBS_DAILY_QA_LOCK_TIMEOUT', 30)
+
+# Seconds between checks for the result of another process
+POLL_INTERVAL = 0.05
+
+_lock = threading.Lock()
+_flights = {}
+
+
+class Flight(object):
+    """Result of a computation shared by the threads waiting for it."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _acquire(lock_path):
+    """Lock the lock file, returning its descriptor, or None if another
+       process holds the lock.
+
+       The lock is an fcntl lock, so it is released if its holder dies. The
+       holder removes the lock file before it releases the lock, so a lock
+       taken on a file that has since been removed is retried on the new
+       file."""
+
+    directory = os.path.dirname(lock_path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by another process in the meantime
+            pass
+    while True:
+        fd = os.open(lock_path, os.O_CREAT | os.O_WRONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            os.close(fd)
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return None
+        try:
+            if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                return fd
+        except OSError:
+            # Removed by the previous holder in the meantime
+            pass
+        os.close(fd)
+
+
+def _release(fd, lock_path):
+    """Remove the lock file and release the lock held on it."""
+
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+    os.close(fd)
+
+
+def _run_exclusive(lock_path, done, compute):
+    """Return the result of done() once another process holding the lock
+       has computed it, or hold the lock and compute it.
+
+       A process that has waited LOCK_TIMEOUT seconds, e.g. for a process
+       that is stuck, computes the result without the lock."""
+
+    if fcntl is None:
+        return compute()
+
+    fd = _acquire(lock_path)
+    if fd is None:
+        end = time.time() + LOCK_TIMEOUT
+        with timing.stage('singleflight_wait'):
+            while fd is None:
+                time.sleep(POLL_INTERVAL)
+                result = done()
+                if result is not None:
+                    return result
+                if time.time() > end:
+                    return compute()
+                fd = _acquire(lock_path)
+
+    try:
+        # The result may have been stored while the lock was taken
+        result = done()
+        return compute() if result is None else result
+    finally:
+        _release(fd, lock_path)
+
+
+def run(key, lock_path, done, compute):
+    """Return the result for the key, computing it at most once for the
+       concurrent requests of every thread and process.
+
+       key: identifies the result within the process
+       lock_path: lock file that identifies the result between processes
+       done: returns the stored result, or None if it is not available
+       compute: computes and stores the result, and returns it
+
+       The first thread to request the key computes the result while the
+       other threads wait for it. Between processes the first to lock the
+       lock file computes the result while the others wait for done() to
+       return it. An exception of compute() is raised in every waiting
+       thread."""
+
+    result = done()
+    if result is not None:
+        return result
+
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        with timing.stage('singleflight_wait'):
+            flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _run_exclusive(lock_path, done, compute)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.event.set()
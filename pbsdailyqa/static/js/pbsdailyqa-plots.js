@@ -0,0 +1,356 @@
+// Draw the PBS Daily QA plots in the browser from the spot data API
+var plotWidth = 720;
+var plotHeight = 600;
+var plotRows = 4;
+var plotCols = 4;
+
+function decodeArray(encoded) {
+    // Decode a base64 little endian float32 array into a Float32Array
+    "use strict";
+    var binary = window.atob(encoded.data);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return {data: new Float32Array(bytes.buffer), shape: encoded.shape};
+}
+
+function decodeSpotData(spotdata) {
+    "use strict";
+    $.each(["x", "y", "xs", "ys", "spots"], function(i, key) {
+        spotdata[key] = decodeArray(spotdata[key]);
+    });
+    return spotdata;
+}
+
+function arrayRow(array, k) {
+    // Return the k-th row (or matrix) of the decoded array
+    "use strict";
+    var size = array.data.length / array.shape[0];
+    return array.data.subarray(k * size, (k + 1) * size);
+}
+
+function arrayMax(values) {
+    "use strict";
+    var max = -Infinity;
+    for (var i = 0; i < values.length; i++) {
+        max = Math.max(max, values[i]);
+    }
+    return max;
+}
+
+function fmt(value, digits) {
+    "use strict";
+    return String(parseFloat(value.toPrecision(digits || 6)));
+}
+
+/****************************************************/
+function Panel(ctx, k, left, top, width, height) {
+    // Drawing area of a single spot with a data to pixel transform
+    "use strict";
+    this.ctx = ctx;
+    this.k = k;
+    this.left = left;
+    this.top = top;
+    this.width = width;
+    this.height = height;
+}
+
+Panel.prototype.setLimits = function(x0, x1, y0, y1) {
+    "use strict";
+    this.x0 = x0;
+    this.x1 = x1;
+    this.y0 = y0;
+    this.y1 = y1;
+};
+
+Panel.prototype.px = function(x) {
+    "use strict";
+    return this.left + (x - this.x0) / (this.x1 - this.x0) * this.width;
+};
+
+Panel.prototype.py = function(y) {
+    "use strict";
+    return this.top + (this.y1 - y) / (this.y1 - this.y0) * this.height;
+};
+
+Panel.prototype.line = function(x0, y0, x1, y1, color, width, dashed) {
+    "use strict";
+    var ctx = this.ctx;
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(this.left, this.top, this.width, this.height);
+    ctx.clip();
+    ctx.beginPath();
+    ctx.strokeStyle = color;
+    ctx.lineWidth = width;
+    if (ctx.setLineDash) {
+        ctx.setLineDash(dashed ? [6, 4] : []);
+    }
+    ctx.moveTo(this.px(x0), this.py(y0));
+    ctx.lineTo(this.px(x1), this.py(y1));
+    ctx.stroke();
+    ctx.restore();
+};
+
+Panel.prototype.ellipse = function(x, y, rx, ry, color) {
+    "use strict";
+    var ctx = this.ctx;
+    var cx = this.px(x), cy = this.py(y);
+    var sx = Math.abs(this.px(x + rx) - cx), sy = Math.abs(this.py(y + ry) - cy);
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(this.left, this.top, this.width, this.height);
+    ctx.clip();
+    ctx.beginPath();
+    ctx.strokeStyle = color;
+    ctx.lineWidth = 1;
+    // Scale only while the path is built so the line width is not scaled
+    ctx.save();
+    ctx.translate(cx, cy);
+    ctx.scale(Math.max(sx, 1e-6), Math.max(sy, 1e-6));
+    ctx.arc(0, 0, 1, 0, 2 * Math.PI);
+    ctx.restore();
+    ctx.stroke();
+    ctx.restore();
+};
+
+Panel.prototype.frame = function(title) {
+    "use strict";
+    var ctx = this.ctx;
+    ctx.strokeStyle = "black";
+    ctx.lineWidth = 1;
+    ctx.strokeRect(this.left + 0.5, this.top + 0.5, this.width, this.height);
+    ctx.fillStyle = "blue";
+    ctx.font = "10px sans-serif";
+    ctx.textAlign = "center";
+    ctx.textBaseline = "bottom";
+    ctx.fillText(title, this.left + this.width / 2, this.top - 2);
+};
+
+Panel.prototype.ticks = function(xticks, yticks) {
+    "use strict";
+    var ctx = this.ctx;
+    ctx.fillStyle = "black";
+    ctx.font = "9px sans-serif";
+    ctx.textBaseline = "top";
+    ctx.textAlign = "center";
+    for (var i = 0; i < xticks.length; i++) {
+        ctx.fillText(fmt(xticks[i], 3), this.px(xticks[i]),
+                     this.top + this.height + 2);
+    }
+    ctx.textBaseline = "middle";
+    ctx.textAlign = "right";
+    for (var j = 0; j < yticks.length; j++) {
+        ctx.fillText(fmt(yticks[j], 3), this.left - 2, this.py(yticks[j]));
+    }
+};
+
+function layoutPanels(ctx, square) {
+    // Split the canvas into a grid of panels, one for each spot
+    "use strict";
+    var margin = {left: 45, right: 20, top: 20, bottom: 35};
+    var cellWidth = (plotWidth - margin.left - margin.right) / plotCols;
+    var cellHeight = (plotHeight - margin.top - margin.bottom) / plotRows;
+    var width = cellWidth - 12, height = cellHeight - 20;
+    if (square) {
+        width = height = Math.min(width, height);
+    }
+    var panels = [];
+    for (var k = 0; k < plotRows * plotCols; k++) {
+        var row = Math.floor(k / plotCols), col = k % plotCols;
+        panels.push(new Panel(
+            ctx, k,
+            margin.left + col * cellWidth + (cellWidth - width) / 2,
+            margin.top + row * cellHeight + 14, width, height));
+    }
+    ctx.fillStyle = "white";
+    ctx.fillRect(0, 0, plotWidth, plotHeight);
+    ctx.fillStyle = "black";
+    ctx.font = "10px sans-serif";
+    ctx.textAlign = "center";
+    ctx.textBaseline = "bottom";
+    ctx.fillText("Millimeters", plotWidth / 2, plotHeight - 2);
+    return panels;
+}
+
+/****************************************************/
+function toleranceBands(center, halfwidth, pass, tol) {
+    // Return the pass, tolerance and action ranges around the center
+    "use strict";
+    return [
+        [center - halfwidth - halfwidth * pass, center + halfwidth + halfwidth * pass],
+        [center - halfwidth - halfwidth * tol, center + halfwidth + halfwidth * tol]];
+}
+
+function drawProfiles(ctx, spotdata, annotations, axis) {
+    "use strict";
+    var panels = layoutPanels(ctx, false);
+    var profiles = axis === "x" ? spotdata.x : spotdata.y;
+    var coords = axis === "x" ? spotdata.xs : spotdata.ys;
+    var rowMax = [];
+    for (var r = 0; r < plotRows; r++) {
+        rowMax.push(0);
+        for (var c = 0; c < plotCols; c++) {
+            rowMax[r] = Math.max(
+                rowMax[r], arrayMax(arrayRow(profiles, r * plotCols + c)));
+        }
+    }
+
+    $.each(panels, function(k, panel) {
+        var xs = arrayRow(coords, k), profile = arrayRow(profiles, k);
+        var ymax = rowMax[Math.floor(k / plotCols)] * 1.05;
+        var actpos = axis === "x" ? spotdata.ActualPositionX[k] : spotdata.ActualPositionY[k];
+        var pos = axis === "x" ? spotdata.positionX[k] : spotdata.positionY[k];
+        var bands, alphas = [0.2, 0.2, 0.2];
+        if (annotations === "position") {
+            var p = spotdata.tolerances.position[0], t = spotdata.tolerances.position[1];
+            bands = [[actpos - p, actpos + p], [actpos - t, actpos + t]];
+            var offset = Math.abs(pos - actpos);
+            alphas[offset <= p ? 0 : (offset <= t ? 1 : 2)] = 0.5;
+        } else {
+            var actsize = (axis === "x" ? spotdata.ActualFWHMX[k] : spotdata.ActualFWHMY[k]) / 20;
+            bands = toleranceBands(actpos, actsize, spotdata.tolerances.size[0],
+                                   spotdata.tolerances.size[1]);
+        }
+        panel.setLimits(Math.min(xs[0], 0), xs[xs.length - 1], 0, ymax);
+
+        // Fill the area below the profile in the color of each band
+        var colors = ["green", "orange", "red"];
+        for (var i = 0; i < xs.length - 1; i++) {
+            var mid = (xs[i] + xs[i + 1]) / 2;
+            var band = (mid >= bands[0][0] && mid <= bands[0][1]) ? 0 :
+                ((mid >= bands[1][0] && mid <= bands[1][1]) ? 1 : 2);
+            ctx.globalAlpha = alphas[band];
+            ctx.fillStyle = colors[band];
+            ctx.beginPath();
+            ctx.moveTo(panel.px(xs[i]), panel.py(0));
+            ctx.lineTo(panel.px(xs[i]), panel.py(profile[i]));
+            ctx.lineTo(panel.px(xs[i + 1]), panel.py(profile[i + 1]));
+            ctx.lineTo(panel.px(xs[i + 1]), panel.py(0));
+            ctx.closePath();
+            ctx.fill();
+        }
+        ctx.globalAlpha = 1;
+
+        ctx.strokeStyle = "#1f77b4";
+        ctx.lineWidth = 1;
+        ctx.beginPath();
+        for (var j = 0; j < xs.length; j++) {
+            ctx[j === 0 ? "moveTo" : "lineTo"](panel.px(xs[j]), panel.py(profile[j]));
+        }
+        ctx.stroke();
+
+        var title = axis + "(" + fmt(spotdata.ActualPositionY[k]) + "," +
+            fmt(spotdata.ActualPositionX[k]);
+        if (annotations === "position") {
+            panel.line(pos, 0, pos, ymax, "red", 2, true);
+            panel.line(actpos, 0, actpos, ymax, "blue", 1, false);
+            title += ", R" + spotdata.ActualEnergy[k] + ")";
+        } else {
+            var edge = axis === "x" ? spotdata.fwhmX[k][0] : spotdata.fwhmY[k][0];
+            var halfmax = spotdata.Halfmax[k];
+            panel.line(edge, 0, edge, halfmax, "red", 2, true);
+            panel.line(2 * pos - edge, 0, 2 * pos - edge, halfmax, "red", 2, true);
+            panel.line(edge, halfmax, 2 * pos - edge, halfmax, "red", 2, true);
+            var actsigma = axis === "x" ? spotdata.ActualSigmaX[k] : spotdata.ActualSigmaY[k];
+            title += ":" + fmt(actsigma, 3) + ")";
+        }
+        panel.frame(title);
+        panel.ticks(k >= (plotRows - 1) * plotCols ? [panel.x0, panel.x1] : [],
+                    k % plotCols === 0 ? [0, Math.round(ymax)] : []);
+    });
+}
+
+/****************************************************/
+function jet(value) {
+    // Map a value between 0 and 1 to the jet colormap
+    "use strict";
+    function channel(offset) {
+        return Math.round(255 * Math.min(1, Math.max(0, 1.5 - Math.abs(4 * value - offset))));
+    }
+    return [channel(3), channel(2), channel(1)];
+}
+
+function drawImage(ctx, panel, image, rows, cols, color) {
+    // Draw the ROI scaled (nearest neighbour) to fill the panel
+    "use strict";
+    var width = Math.round(panel.width), height = Math.round(panel.height);
+    var pixels = ctx.createImageData(width, height);
+    for (var py = 0; py < height; py++) {
+        var r = Math.min(rows - 1, Math.floor(py / height * rows));
+        for (var px = 0; px < width; px++) {
+            var c = Math.min(cols - 1, Math.floor(px / width * cols));
+            var rgb = color(image[r * cols + c]);
+            var i = 4 * (py * width + px);
+            pixels.data[i] = rgb[0];
+            pixels.data[i + 1] = rgb[1];
+            pixels.data[i + 2] = rgb[2];
+            pixels.data[i + 3] = 255;
+        }
+    }
+    ctx.putImageData(pixels, Math.round(panel.left), Math.round(panel.top));
+}
+
+function drawSpots(ctx, spotdata, annotations) {
+    "use strict";
+    var panels = layoutPanels(ctx, true);
+    var rows = spotdata.spots.shape[1], cols = spotdata.spots.shape[2];
+
+    $.each(panels, function(k, panel) {
+        var xs = arrayRow(spotdata.xs, k), ys = arrayRow(spotdata.ys, k);
+        var image = arrayRow(spotdata.spots, k);
+        // Rows of the ROI go down the image, as in the server side plots
+        panel.setLimits(xs[0], xs[xs.length - 1], ys[ys.length - 1], ys[0]);
+        var title;
+
+        if (annotations === "position") {
+            var max = arrayMax(image);
+            drawImage(ctx, panel, image, rows, cols, function(v) {
+                return jet(max > 0 ? Math.max(0, v) / max : 0);
+            });
+            var ax = spotdata.ActualPositionX[k], ay = spotdata.ActualPositionY[k];
+            $.each(spotdata.tolerances.position, function(i, tol) {
+                panel.ellipse(ax, ay, tol, tol, "white");
+            });
+            panel.line(ax, ys[0], ax, ys[ys.length - 1], "white", 1, false);
+            panel.line(xs[0], ay, xs[xs.length - 1], ay, "white", 1, false);
+            panel.line(spotdata.positionX[k], ys[0], spotdata.positionX[k],
+                       ys[ys.length - 1], "black", 1, true);
+            panel.line(xs[0], spotdata.positionY[k], xs[xs.length - 1],
+                       spotdata.positionY[k], "black", 1, true);
+            title = fmt(ay) + "," + fmt(ax) + ":R" + spotdata.ActualEnergy[k];
+        } else {
+            var halfmax = spotdata.Halfmax[k];
+            drawImage(ctx, panel, image, rows, cols, function(v) {
+                return v >= halfmax ? [74, 152, 201] : [247, 251, 255];
+            });
+            var px = spotdata.positionX[k], ppy = spotdata.positionY[k];
+            panel.line(spotdata.fwhmX[k][0], ppy, spotdata.fwhmX[k][1], ppy, "white", 1, false);
+            panel.line(px, spotdata.fwhmY[k][0], px, spotdata.fwhmY[k][1], "white", 1, false);
+            $.each(spotdata.tolerances.size, function(i, tol) {
+                panel.ellipse(px, ppy, spotdata.sigmaX[k] / 10 * (1 + tol),
+                              spotdata.sigmaY[k] / 10 * (1 + tol),
+                              i === 0 ? "orange" : "red");
+            });
+            title = fmt(spotdata.ActualPositionY[k]) + "," +
+                fmt(spotdata.ActualPositionX[k]) + ",Y:" +
+                fmt(spotdata.ActualSigmaY[k], 3) + ",X:" +
+                fmt(spotdata.ActualSigmaX[k], 3);
+        }
+        panel.frame(title);
+    });
+}
+
+/****************************************************/
+function drawPlot(canvas, spotdata, plotType, annotations, axis) {
+    "use strict";
+    canvas.width = plotWidth;
+    canvas.height = plotHeight;
+    var ctx = canvas.getContext("2d");
+    if (plotType === "profile") {
+        drawProfiles(ctx, spotdata, annotations, axis);
+    } else {
+        drawSpots(ctx, spotdata, annotations);
+    }
+}
@@ -18,21 +18,39 @@ function testListInstances() {
         return testlistinstances.test_list_instances;
     }
     else {
-        return {};
+        return [];
     }
 }
 
+function selectedTestListInstance() {
+    // Return the day bundle entry of the selected test list instance
+    "use strict";
+    var id = parseInt($("#testlistinstances").val(), 10);
+    var selected;
+    $.each(testListInstances(), function(key, value) {
+        if (value.id === id) {
+            selected = value;
+        }
+    });
+    return selected;
+}
+
 function dateList() {
     // Generate a list of sorted valid dates to select from
     "use strict";
-    if ($("body").data("testlistinstances") !== undefined) {
-        return Object.keys(testListInstances()).sort();
+    if ($("body").data("dates") !== undefined) {
+        return $("body").data("dates");
     }
     else {
         return [];
     }
 }
 
+function utcList() {
+    "use strict";
+    return $("body").data("units").units[$("#units").val()].utc;
+}
+
 /****************************************************/
 function reviewTestList() {
     "use strict";
@@ -41,18 +59,109 @@ function reviewTestList() {
 }
 
 /****************************************************/
+function drawSpotData(spotdata) {
+    "use strict";
+    $("#plotimg").hide();
+    $("#plotcanvas").show();
+    drawPlot($("#plotcanvas")[0], spotdata, $("#plot-type").val(),
+             $("#annotations").val(), $("#profile-axis").val());
+}
+
+function loadSpotData(fileOptions) {
+    // Fetch the spot data once per test list instance and draw it locally
+    "use strict";
+    var key = $.param(fileOptions);
+    var spotdata = $("body").data("spotdata");
+    if ((spotdata !== undefined) && (spotdata.key === key)) {
+        drawSpotData(spotdata.data);
+        return;
+    }
+    $.ajax({
+        type: "get",
+        url: "spotdata/",
+        dataType: "json",
+        data: fileOptions,
+        success: function(result) {
+            $("body").data("spotdata", {key: key, data: decodeSpotData(result)});
+            drawSpotData(result);
+        },
+        error: function(error) {
+            if (typeof console !== "undefined") {
+                console.log(
+                    "Could not load spot data. Error message: " + error.statusText);
+            }
+        }
+    });
+}
+
 function loadPlot() {
     "use strict";
-    var plotOptions = {
+    var fileOptions = {
         "id": $("#testlistinstances").val(),
-        "plot_type": $("#plot-type").val(),
-        "annotations": $("#annotations").val(),
         "spot_uti": $("body").data("units").units[$("#units").val()].spot_uti
     };
+    if ($("#render-mode").val() === "browser") {
+        loadSpotData(fileOptions);
+        return;
+    }
+    var plotOptions = $.extend({
+        "plot_type": $("#plot-type").val(),
+        "annotations": $("#annotations").val()
+    }, fileOptions);
     if ($("#plot-profile-options").is(":visible")) {
         plotOptions.axis = $("#profile-axis").val();
     }
-    $("#plotimg").attr("src", "plot.png?" + $.param(plotOptions));
+    // Use the content addressed plot of the day bundle when available
+    var src = "plot.png?" + $.param(plotOptions);
+    var tli = selectedTestListInstance();
+    $("#plotcanvas").hide();
+    $("#ploterror").hide();
+    if ((tli !== undefined) && (tli.error !== undefined)) {
+        // The spot file failed validation, e.g. it is from another day
+        ++plotRequest;
+        showPlotError(tli.error);
+        return;
+    }
+    if ((tli !== undefined) && (tli.plots !== undefined)) {
+        src = tli.plots[[plotOptions.plot_type, plotOptions.annotations,
+                         plotOptions.axis || "x"].join("_")];
+    }
+    requestPlot(src, ++plotRequest);
+}
+
+// Number of the latest plot request, so earlier requests stop retrying
+var plotRequest = 0;
+
+function showPlotError(message) {
+    "use strict";
+    $("#plotimg").hide();
+    $("#ploterror").text(message).show();
+}
+
+function requestPlot(src, request) {
+    "use strict";
+    // Show the plot once it is rendered, retrying while it is being rendered
+    // or the server is busy
+    $.ajax({
+        type: "head",
+        url: src,
+        complete: function(xhr) {
+            if (request !== plotRequest) {
+                return;
+            }
+            if ((xhr.status === 202) || (xhr.status === 503)) {
+                var retry = parseInt(xhr.getResponseHeader("Retry-After"), 10);
+                setTimeout(function() {
+                    requestPlot(src, request);
+                }, 1000 * (isNaN(retry) ? 1 : retry));
+            } else if (xhr.status === 400) {
+                showPlotError("The spot file of this test could not be " +
+                              "analysed.");
+            } else {
+                $("#plotimg").show().attr("src", src);
+            }
+        }
+    });
 }
 
 /****************************************************/
@@ -77,19 +186,7 @@ function loadDates() {
         var date = convertDate(e.date);
         $("#testlistinstances").empty();
         if (date !== "") {
-            $.each(testListInstances()[date], function(key, value) {
-                $("#testlistinstances")
-                    .append($("<option></option>")
-                        .attr("value", value.id)
-                        .text(key + 1 + ". " + value.work_completed));
-            });
-            $("#numtestlistinstances").html(testListInstances()[date].length);
-            // Set the status of the prev / next buttons
-            var currdate = dateList().indexOf($("#date").val());
-            $("#dateprev").prop("disabled", (currdate === 0));
-            $("#datenext").prop("disabled", (currdate === (dateList().length - 1)));
-            // Load plot
-            loadPlot();
+            loadTestlistinstancesForDate(date);
         }
     });
 
@@ -107,19 +204,59 @@ function loadDates() {
 }
 
 /****************************************************/
-function loadTestlistinstances() {
+function loadTestlistinstancesForDate(date) {
     "use strict";
-    var utclist = $("body").data("units").units[$("#units").val()].utc;
     $.ajax({
         type: "get",
-        url: "testlistinstance/",
+        url: "day/",
         contentType: "application/json",
         dataType: "json",
-        data: {id: utclist},
+        data: {
+            id: utcList(),
+            date: date,
+            spot_uti: $("body").data("units").units[$("#units").val()].spot_uti
+        },
         traditional: true,
         success: function(result) {
             // Update the list of testslistinstances
             $("body").data("testlistinstances", result);
+            var instances = testListInstances();
+            $("#testlistinstances").empty();
+            $.each(instances, function(key, value) {
+                $("#testlistinstances")
+                    .append($("<option></option>")
+                        .attr("value", value.id)
+                        .text(key + 1 + ". " + value.work_completed));
+            });
+            $("#numtestlistinstances").html(instances.length);
+            // Set the status of the prev / next buttons
+            var currdate = dateList().indexOf(date);
+            $("#dateprev").prop("disabled", (currdate === 0));
+            $("#datenext").prop("disabled", (currdate === (dateList().length - 1)));
+            // Load plot
+            loadPlot();
+        },
+        error: function(error) {
+            if (typeof console !== "undefined") {
+                $("#plot").text(
+                    "Could not load test lists. Error message: " + error.statusText);
+            }
+        }
+    });
+}
+
+function loadTestlistinstances() {
+    "use strict";
+    $.ajax({
+        type: "get",
+        url: "testlistinstance/dates/",
+        contentType: "application/json",
+        dataType: "json",
+        data: {id: utcList()},
+        traditional: true,
+        success: function(result) {
+            // Update the list of dates that have testlistinstances
+            $("body").data("dates", result.dates.sort());
             // Select the most recent date
             $(".date").datepicker("setDate", dateList()[dateList().length - 1]);
         },
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# synthetic.py
+"""Generate synthetic PBS daily QA spot files with a known ground truth."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+from math import sqrt, log
+
+import numpy as np
+
+import opg
+import roi
+
+# Conversion from the standard deviation of a Gaussian to its FWHM
+FWHM_SIGMA = 2 * sqrt(2 * log(2))
+
+# Header of an OmniPro I'mRT export of the daily QA spot pattern
+HEADER = [
+    ('Separator', '[TAB]'),
+    ('Workspace Name', 'PBS'),
+    ('File Name', 'O:\\temp\\dailyQAfiles\\position_{date}.opg'),
+    ('Image Name', 'position'),
+    ('Radiation Type', 'Protons'),
+    ('Energy', '0.0 MeV'),
+    ('SSD', '0.0 mm'),
+    ('SID', '0.0 mm'),
+    ('Field Size Cr', '0.0 mm'),
+    ('Field Size In', '0.0 mm'),
+    ('Data Type', 'Abs. Dose'),
+    ('Data Factor', '1.000'),
+    ('Data Unit', 'mGy'),
+    ('Length Unit', 'cm'),
+    ('Plane', 'XY'),
+    ('No. of Columns', '{ncols}'),
+    ('No. of Rows', '{nrows}'),
+    ('Number of Bodies', '1'),
+    ('Operators Note', ''),
+    ('Last Modified', '{day}.{month}.{year}'),
+]
+
+
+def make_grid(layout=roi.SPOT_LAYOUT, extent=12.0, spacing=0.1,
+              fwhm=1.2, offsets=0.0, amplitude=400.0, background=15.0,
+              noise=0.5, date='20150818', seed=None):
+    """Return a DoseGrid of Gaussian spots at the positions of the layout
+       along with the ground truth of each spot.
+
+       extent: half width of the square grid (cm)
+       spacing: pixel spacing (cm)
+       fwhm: FWHM of the spots (cm), a scalar or (n,) or (n, 2) x / y array
+       offsets: offset of the spots from the layout (cm), a scalar or
+                (n, 2) x / y array
+       amplitude: peak dose above the background, a scalar or (n,) array
+       background: uniform background dose
+       noise: standard deviation of the Gaussian noise added to the dose
+
+       The ground truth is a dict of the positionX/Y (cm) and the
+       SpotSizeX/Y (FWHM in mm) of each spot."""
+
+    n = len(layout)
+    # Adding zero turns -0.0 into 0.0, as the export writes the origin
+    coords = np.round(np.arange(-extent, extent + spacing / 2, spacing), 6) \
+        + 0.0
+    fwhm = np.broadcast_to(np.asarray(fwhm, dtype=float).T, (2, n)).T
+    offsets = np.broadcast_to(np.asarray(offsets, dtype=float), (n, 2))
+    amplitude = np.broadcast_to(np.asarray(amplitude, dtype=float), (n,))
+
+    x0 = layout['x'] + offsets[:, 0]
+    y0 = layout['y'] + offsets[:, 1]
+    sx = fwhm[:, 0] / FWHM_SIGMA
+    sy = fwhm[:, 1] / FWHM_SIGMA
+
+    # Each spot is separable, so sum the outer products of its profiles
+    gx = np.exp(-0.5 * ((coords - x0[:, np.newaxis]) / sx[:, np.newaxis]) ** 2)
+    gy = np.exp(-0.5 * ((coords - y0[:, np.newaxis]) / sy[:, np.newaxis]) ** 2)
+    dose = np.einsum('n,ny,nx->yx', amplitude, gy, gx) + background
+    if noise:
+        dose += np.random.RandomState(seed).normal(0, noise, dose.shape)
+
+    header = dict((k, v.format(date=date, year=date[:4], month=date[4:6],
+                               day=date[6:], nrows=len(coords),
+                               ncols=len(coords))) for k, v in HEADER)
+    truth = {'positionX': x0, 'positionY': y0,
+             'SpotSizeX': fwhm[:, 0] * 10, 'SpotSizeY': fwhm[:, 1] * 10}
+    return opg.DoseGrid(dose, coords, coords.copy(), header), truth
+
+
+def write_opg(filename, grid):
+    """Write the DoseGrid as an OmniPro I'mRT ASCII (OPG) file.
+
+       The coordinates are written in the fixed width fields of the export,
+       right aligned in 7 characters with 3 decimals followed by one space
+       (columns) or three spaces (rows), e.g. ' -6.200 ' and '  2.200   '."""
+
+    lines = ['<opimrtascii>', '', '<asciiheader>']
+    lines += [k + ':\t' + grid.header.get(k, '') for k, v in HEADER]
+    lines += ['</asciiheader>', '', '<asciibody>',
+              'Plane Position:     0.00 cm', '',
+              'X[cm]\t' + ''.join('%7.3f \t' % x for x in grid.x),
+              'Y[cm]']
+    rowformat = '\t'.join(['%8.3f'] * grid.dose.shape[1]) + '\t'
+    for y, row in zip(grid.y, grid.dose):
+        lines.append('%7.3f   \t' % y + rowformat % tuple(row))
+    lines += ['</asciibody>', '', '</opimrtascii>', '']
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines))
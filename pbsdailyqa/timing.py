@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# timing.py
+"""Time the stages of the analysis and plotting of each request."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import sys
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from timeit import default_timer
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Upper bounds (s) of the buckets of the stage duration histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+_metrics = {}
+
+
+def max_rss():
+    """Return the peak resident memory of the process in bytes."""
+
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and OS X bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def record(name, seconds, rss=None, request=True):
+    """Record the duration of a stage for the current request and in the
+       metrics of the process.
+
+       rss: peak resident memory (bytes) of the process that ran the stage,
+            if it was not this process
+       request: whether the stage is part of the current request"""
+
+    stages = getattr(_local, 'stages', None)
+    if request and stages is not None:
+        stages.append((name, seconds))
+
+    if rss is None:
+        rss = max_rss()
+    with _lock:
+        m = _metrics.get(name)
+        if m is None:
+            m = _metrics[name] = {'buckets': [0] * len(BUCKETS),
+                                  'count': 0, 'sum': 0.0, 'max_rss': 0}
+        for i in range(bisect_left(BUCKETS, seconds), len(BUCKETS)):
+            m['buckets'][i] += 1
+        m['count'] += 1
+        m['sum'] += seconds
+        m['max_rss'] = max(m['max_rss'], rss)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as the given stage."""
+
+    start = default_timer()
+    try:
+        yield
+    finally:
+        record(name, default_timer() - start)
+
+
+def collect(func, *args):
+    """Run func(*args), e.g. in a worker process, and return its result with
+       the (name, seconds) stages timed while it ran and the peak resident
+       memory of the process, to be recorded with merge()."""
+
+    _local.stages = []
+    try:
+        return func(*args), _local.stages, max_rss()
+    finally:
+        _local.stages = None
+
+
+def merge(stages, rss, request=True):
+    """Record the stages timed by collect() in another process in the
+       metrics of this process, and in the current request if request is
+       true."""
+
+    for name, seconds in stages:
+        record(name, seconds, rss, request)
+
+
+def server_timing(stages):
+    """Return the Server-Timing header value of the (name, seconds) stages."""
+    return ', '.join('%s;dur=%.3f' % (name, 1000 * seconds)
+                     for name, seconds in stages)
+
+
+def timed(view):
+    """Time the view as a whole and report every stage timed during the
+       request in a Server-Timing header."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        _local.stages = []
+        try:
+            with stage(view.__name__):
+                response = view(request, *args, **kwargs)
+            response['Server-Timing'] = server_timing(_local.stages)
+        finally:
+            _local.stages = None
+        return response
+    return wrapper
+
+
+def metrics():
+    """Return the stage metrics of the process in the Prometheus text
+       exposition format."""
+
+    with _lock:
+        items = sorted((k, dict(v, buckets=list(v['buckets'])))
+                       for k, v in _metrics.items())
+
+    lines = ['# HELP pbsdailyqa_stage_seconds Duration of each stage.',
+             '# TYPE pbsdailyqa_stage_seconds histogram']
+    for name, m in items:
+        for le, count in zip(BUCKETS, m['buckets']):
+            lines.append('pbsdailyqa_stage_seconds_bucket'
+                         '{stage="%s",le="%g"} %d' % (name, le, count))
+        lines += [
+            'pbsdailyqa_stage_seconds_bucket{stage="%s",le="+Inf"} %d' %
+            (name, m['count']),
+            'pbsdailyqa_stage_seconds_sum{stage="%s"} %r' % (name, m['sum']),
+            'pbsdailyqa_stage_seconds_count{stage="%s"} %d' %
+            (name, m['count'])]
+
+    lines += ['# HELP pbsdailyqa_stage_max_rss_bytes Peak resident memory of '
+              'the process at the end of each stage.',
+              '# TYPE pbsdailyqa_stage_max_rss_bytes gauge']
+    lines += ['pbsdailyqa_stage_max_rss_bytes{stage="%s"} %d' %
+              (name, m['max_rss']) for name, m in items]
+    lines += ['# HELP pbsdailyqa_max_rss_bytes Peak resident memory of the '
+              'process.',
+              '# TYPE pbsdailyqa_max_rss_bytes gauge',
+              'pbsdailyqa_max_rss_bytes %d' % max_rss()]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# trends.py
+"""Query the results table for the trend of spot values over time."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import os
+import threading
+
+import numpy as np
+
+import analysis
+import results
+
+# Values of the results table that can be trended
+VALUES = results.SPOT_COLUMNS + results.FILE_VALUES
+
+TREND_DTYPE = [('tli', int), ('date', 'datetime64[D]'),
+               ('reference', object)] + [(v, float) for v in VALUES]
+
+_lock = threading.Lock()
+_index = {}
+_stamp = None
+
+
+def build_index(columns):
+    """Index the rows of the current analysis version by (unit, spot).
+
+       columns: dict of the columns of the results table
+
+       Each entry is a structured array of the TestListInstance id, date,
+       key of the reference table and values of the spot sorted by date.
+       When a file was analysed more than once the last rows are used."""
+
+    current = columns['version'].astype(int) == analysis.ANALYSIS_VERSION
+    table = np.zeros(np.count_nonzero(current), dtype=TREND_DTYPE)
+    table['tli'] = columns['tli'][current].astype(int)
+    table['date'] = columns['date'][current].astype('datetime64[D]')
+    table['reference'] = columns['reference'][current]
+    for v in VALUES:
+        table[v] = columns[v][current].astype(float)
+    units = columns['unit'][current].astype(int)
+    spots = columns['spot'][current]
+
+    # Keep the last row of each spot of each file
+    keys = np.rec.fromarrays([units, spots, table['tli']])[::-1]
+    last = len(keys) - 1 - np.unique(keys, return_index=True)[1]
+
+    # Group the rows by unit and spot, each sorted by date
+    order = last[np.lexsort(
+        (table['date'][last], spots[last], units[last]))]
+    table, units, spots = table[order], units[order], spots[order]
+    bounds = np.flatnonzero(
+        (units[1:] != units[:-1]) | (spots[1:] != spots[:-1])) + 1
+    return dict(((units[i], spots[i]), group) for i, group in zip(
+        np.r_[0, bounds], np.split(table, bounds)) if len(group))
+
+
+def get_index(path=results.RESULTS_PATH):
+    """Return the index of the results table, re-reading the table only
+       when it has changed."""
+
+    global _index, _stamp
+    try:
+        stat = os.stat(path)
+        stamp = (path, stat.st_size, stat.st_mtime)
+    except OSError:
+        return {}
+    with _lock:
+        if stamp != _stamp:
+            _index = build_index(results.read_columns(path))
+            _stamp = stamp
+        return _index
+
+
+def trend(unit, spot, start=None, end=None, path=results.RESULTS_PATH):
+    """Return the results of the spot of the unit between the start and end
+       dates (inclusive) as a structured array sorted by date."""
+
+    table = get_index(path).get((unit, spot))
+    if table is None:
+        return np.zeros(0, dtype=TREND_DTYPE)
+    dates = table['date']
+    lo = 0 if start is None else \
+        np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+    hi = len(dates) if end is None else \
+        np.searchsorted(dates, np.datetime64(end, 'D'), side='right')
+    return table[lo:hi]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# units.py
+"""Mapping of the treatment units to their PBS daily QA tests."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import json
+import time
+import hashlib
+import datetime
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+
+from qatrack.units import models as unitmodels
+
+# Key of the time that the unit configuration last changed. This is kept in
+# the Django cache so that every process sees an invalidation.
+MODIFIED_KEY = 'pbsdailyqa_units_modified'
+
+_lock = threading.Lock()
+_unitlist = None
+
+
+def build_unitlist():
+    """Return the UTCs, name and spot file UnitTestInfo of every unit.
+
+       A single joined query is used for all of the units."""
+
+    rows = unitmodels.Unit.objects.filter(
+        unittestcollection__pk__in=settings.PBS_DAILY_QA_UTC_IDS,
+        unittestinfo__test_id=settings.PBS_DAILY_QA_SPOTFILE_TEST_ID
+    ).order_by("id", "unittestcollection__id").values_list(
+        "id", "name", "unittestcollection__id", "unittestinfo__id")
+
+    units = defaultdict(lambda: {'utc': []})
+    for unit, name, utc, spot_uti in rows:
+        units[unit]['utc'].append(utc)
+        units[unit].update({'name': name, 'spot_uti': spot_uti})
+    return dict(units)
+
+
+def modified():
+    """Return the time that the unit configuration last changed."""
+
+    stamp = shared_cache.get(MODIFIED_KEY)
+    if stamp is None:
+        shared_cache.add(MODIFIED_KEY, time.time(), None)
+        stamp = shared_cache.get(MODIFIED_KEY, time.time())
+    return stamp
+
+
+def invalidate():
+    """Mark the unit configuration as changed in every process."""
+
+    global _unitlist
+    shared_cache.set(MODIFIED_KEY, time.time(), None)
+    with _lock:
+        _unitlist = None
+
+
+def get_unitlist():
+    """Return the JSON of the unit mapping along with its ETag and last
+       modified time, building it only when the configuration changed."""
+
+    global _unitlist
+    stamp = modified()
+    with _lock:
+        if _unitlist is not None and _unitlist[0] == stamp:
+            return _unitlist[1:]
+
+    json_context = json.dumps({'units': build_unitlist()}, sort_keys=True)
+    unitlist = (stamp, json_context,
+                hashlib.sha1(json_context.encode('utf-8')).hexdigest(),
+                datetime.datetime.utcfromtimestamp(int(stamp)))
+    with _lock:
+        _unitlist = unitlist
+    return unitlist[1:]
+
+
+def etag(request, *args, **kwargs):
+    """ETag of the unit list response."""
+    return get_unitlist()[1]
+
+
+def last_modified(request, *args, **kwargs):
+    """Last modified time of the unit list response."""
+    return get_unitlist()[2]
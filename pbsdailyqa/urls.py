@@ -1,5 +1,6 @@
 from django.conf.urls import patterns, url  # include
 from django.views.decorators.cache import cache_page
+import timing
 import views
 
 # Uncomment the next two lines to enable the admin:
@@ -26,11 +27,41 @@ urlpatterns = patterns(
     url(r"^testlistinstance/$",
         views.get_testlistinstancelist,
         name="testlistinstancelist"),
+    url(r"^testlistinstance/dates/$",
+        views.get_testlistinstancedates,
+        name="testlistinstancedates"),
     url(r"^testlistinstance/(?P<pk>\d+)/$",
         views.get_testlistinstance,
         name="testlistinstance"),
+    url(r"^day/$",
+        timing.timed(views.get_day),
+        name="pbsanalysis_day"),
+    url(r"^render/(?P<sha>[0-9a-f]{40})/(?P<version>v\d+r\d+)/"
+        r"(?P<reference>[\w.]+-[0-9a-f]{8})/"
+        r"(?P<plot_type>profile|spot)_(?P<annotations>position|size)_"
+        r"(?P<axis>[xy])\.png$",
+        timing.timed(views.get_render),
+        name="pbsanalysis_render"),
+    url(r"^spotdata/$",
+        timing.timed(cache_page(60 * 60)(views.get_spotdata)),
+        name="pbsanalysis_spotdata"),
+    url(r"^verdicts/$",
+        timing.timed(cache_page(60 * 60)(views.get_verdicts)),
+        name="pbsanalysis_verdicts"),
+    url(r"^compare/$",
+        timing.timed(cache_page(60 * 60)(views.get_comparison)),
+        name="pbsanalysis_compare"),
+    url(r"^compare.png",
+        timing.timed(cache_page(60 * 60)(views.get_comparison_plot)),
+        name="pbsanalysis_compare_plot"),
+    url(r"^trend/$",
+        views.get_trend,
+        name="pbsanalysis_trend"),
     url(r"^plot.png",
-        cache_page(60 * 60)(views.get_plot),
+        timing.timed(cache_page(60 * 60)(views.get_plot)),
         # views.get_plot,
         name="pbsanalysis_plot"),
+    url(r"^metrics/$",
+        views.get_metrics,
+        name="pbsanalysis_metrics"),
 )
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# verdicts.py
+"""Classify the PBS daily QA analysis as pass, tolerance or fail."""
+# Copyright (c) 2015 Aditya Panchal
+
+
+import numpy as np
+
+# Verdicts in order of severity, indexed by the status code of a check
+VERDICTS = np.array(['pass', 'tol', 'fail'])
+
+# Checks of every spot along each axis
+SPOT_CHECKS = ['positionX', 'positionY', 'sizeX', 'sizeY']
+
+# Metrics of each flatness and symmetry region that are checked, with the
+# key of their limits in the spot data
+REGION_CHECKS = ['flatness', 'symmetry']
+REGION_TOLERANCES = {'flatness': 'FlatnessTolerance',
+                     'symmetry': 'SymmetryTolerance'}
+
+
+def masks(deviation, tolerance):
+    """Return the (3, ...) pass, tol and fail masks of the deviations.
+
+       tolerance: (pass, tolerance) limits of the absolute deviation, or an
+                  array of them with the limits along the last axis that
+                  broadcasts against the deviations
+
+       A deviation that is not a number fails."""
+
+    deviation = np.abs(deviation)
+    tolerance = np.asarray(tolerance, dtype=float)
+    passed = deviation <= tolerance[..., 0]
+    within = deviation <= tolerance[..., 1]
+    return np.array([passed, within & ~passed, ~within])
+
+
+def status(deviation, tolerance):
+    """Return the status code of each deviation: 0 pass, 1 tol, 2 fail."""
+    return np.argmax(masks(deviation, tolerance), axis=0)
+
+
+def classify(deviation, tolerance):
+    """Return the verdict, pass, tol or fail, of each absolute deviation
+       given the (pass, tolerance) limits."""
+    return VERDICTS[status(deviation, tolerance)]
+
+
+def regions(spotdata):
+    """Return the names of the flatness and symmetry regions analysed."""
+    return sorted(k[len('flatness'):] for k in spotdata
+                  if k.startswith('flatness'))
+
+
+def region_metrics(spotdata):
+    """Return the flatness and symmetry metrics that have limits in the
+       reference table, and are therefore classified."""
+    return [m for m in REGION_CHECKS if REGION_TOLERANCES[m] in spotdata]
+
+
+def unclassified(spotdata):
+    """Return the flatness and symmetry checks without limits."""
+
+    metrics = region_metrics(spotdata)
+    return [m + name for m in REGION_CHECKS if m not in metrics
+            for name in regions(spotdata)]
+
+
+def check_masks(spotdata):
+    """Classify every check of the analysis at once.
+
+       Returns a dict of the pass, tol and fail masks of each check: (3, n)
+       masks of the position and size of the n spots along each axis, and
+       (3,) masks of the flatness and symmetry of each region whose limits
+       are given by the reference table."""
+
+    # Stack the deviations of every spot check with their limits
+    deviations = np.array([
+        np.subtract(spotdata['positionX'], spotdata['ActualPositionX']),
+        np.subtract(spotdata['positionY'], spotdata['ActualPositionY']),
+        np.divide(spotdata['SpotSizeX'], spotdata['ActualFWHMX']) - 1,
+        np.divide(spotdata['SpotSizeY'], spotdata['ActualFWHMY']) - 1])
+    tolerances = np.array([spotdata['PositionTolerance']] * 2 +
+                          [spotdata['SizeTolerance']] * 2)
+    spots = masks(deviations, tolerances[:, np.newaxis, :])
+
+    checks = dict((check, spots[:, i]) for i, check in enumerate(SPOT_CHECKS))
+
+    # The flatness and symmetry of every region are checked against
+    # absolute limits
+    metrics = region_metrics(spotdata)
+    if not metrics:
+        return checks
+    names = regions(spotdata)
+    values = np.array([[spotdata[metric + name] for name in names]
+                       for metric in metrics], dtype=float)
+    tolerances = np.array([spotdata[REGION_TOLERANCES[metric]]
+                           for metric in metrics])
+    areas = masks(values, tolerances[:, np.newaxis, :])
+    for i, metric in enumerate(metrics):
+        for j, name in enumerate(names):
+            checks[metric + name] = areas[:, i, j]
+    return checks
+
+
+def summary(spotdata):
+    """Return the verdict and status code of every check of the analysis,
+       the number of results with each verdict and the overall verdict,
+       the worst of all checks.
+
+       The position and size checks have the verdict of each spot and the
+       flatness and symmetry checks of each region a single verdict. The
+       flatness and symmetry checks without limits in the reference table
+       are listed as unclassified and do not count towards the verdicts."""
+
+    checks = check_masks(spotdata)
+    codes = dict((k, np.argmax(m, axis=0)) for k, m in checks.items())
+    counts = np.sum([m.reshape(3, -1).sum(axis=1)
+                     for m in checks.values()], axis=0)
+    overall = VERDICTS[max(int(np.max(c)) for c in codes.values())]
+    return {
+        'verdicts': dict((k, VERDICTS[c].tolist()) for k, c in codes.items()),
+        'status': dict((k, c.tolist()) for k, c in codes.items()),
+        'counts': dict(zip(VERDICTS.tolist(), counts.tolist())),
+        'overall': str(overall),
+        'unclassified': unclassified(spotdata),
+    }
+
+
+def spot_verdicts(spotdata):
+    """Return the verdict of every check of the analysis."""
+    return summary(spotdata)['verdicts']
@@ -1,26 +1,42 @@
 # Create your views here.
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.db.models import Q
+from django.core.urlresolvers import reverse
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils import timezone
+from django.views.decorators.http import condition
 
 from qatrack.qa.views.charts import ChartView
 from qatrack.qa import models
-from qatrack.units import models as unitmodels
 
 import os
 import json
-from collections import defaultdict
+import datetime
+from collections import OrderedDict
 
 from tzlocal import get_localzone
 dtformat = "%Y-%m-%d"
 localformat = "%Y-%m-%d %H:%M:%S"
-
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-
-import analysis
+filedtformat = "%Y%m%d"
+
+import background
+import cache
+import compare
+import reftables
+import render
+import serializers
+import timing
+import trends
+import units
+import verdicts
 
 JSON_CONTENT_TYPE = "application/json"
 
+# Default and largest number of TestListInstances returned per request
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 
 class PBSDailyQAReview(ChartView):
     """A simple view wrapper to filter by :model:`units.Unit`"""
@@ -34,64 +50,102 @@ class PBSDailyQAReview(ChartView):
         return "Review PBS Daily QA"
 
 
+@condition(etag_func=units.etag, last_modified_func=units.last_modified)
 def get_unitlist(request):
     """Return all machines and their UnitTestCollections."""
 
-    # Get the UTCs and their respective unit ids
-    unitlist = models.UnitTestCollection.objects.filter(
-        pk__in=settings.PBS_DAILY_QA_UTC_IDS).values_list("unit_id", "id")
-    units = defaultdict(list)
+    json_context = units.get_unitlist()[0]
+
+    response = HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+    # Have browsers revalidate the unit list with the ETag on every load
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def get_date_range(request, start='from', end='to'):
+    """Return the aware start and end of the local from / to dates of the
+       request, either of which is None when not given or invalid."""
+
+    tz = get_localzone()
+    bounds = []
+    for param, days in ((start, 0), (end, 1)):
+        try:
+            date = datetime.datetime.strptime(request.GET[param], dtformat)
+            bounds.append(timezone.make_aware(
+                date + datetime.timedelta(days=days), tz))
+        except (KeyError, ValueError):
+            bounds.append(None)
+    return bounds
 
-    # Create a mapping of units to UTCs
-    for k, v in unitlist:
-        units[k].append(v)
-    units = dict(units)
 
-    # Get the name of each unit
-    unitnames = dict(unitmodels.Unit.objects.filter(
-        pk__in=units.keys()).values_list("id", "name"))
+def get_testlistinstancedates(request):
+    """Return the local dates that have TestListInstances for the given
+       UnitTestCollections."""
 
-    # Get the mapping for the spot position upload test to the UnitTestInfo id
-    spottutilist = dict(models.UnitTestInfo.objects.filter(
-        test_id__in=[settings.PBS_DAILY_QA_SPOTFILE_TEST_ID],
-        unit_id__in=units.keys()
-    ).values_list("unit_id", "id"))
+    # Get the UTC ids from the request
+    utclist = request.GET.getlist('id', [])
 
-    # Add the additional information to each unit
-    for unit, utc in units.items():
-        units[unit] = {'utc': utc,
-                       'name': unitnames[unit],
-                       'spot_uti': spottutilist[unit]}
+    dates = models.TestListInstance.objects.filter(
+        unit_test_collection__id__in=utclist
+    ).datetimes('work_completed', 'day', tzinfo=get_localzone())
 
-    json_context = json.dumps({'units': units})
+    json_context = json.dumps(
+        {"dates": [d.strftime(dtformat) for d in dates]})
 
     return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
 
 
 def get_testlistinstancelist(request):
-    """Return all TestListInstances for the given UnitTestCollection."""
+    """Return the TestListInstances for the given UnitTestCollections.
+
+       The most recent instances are returned first, optionally limited to
+       the from / to dates, a page of at most limit instances at a time. The
+       next page is requested with the cursor returned with each page."""
 
     # Get the UTC ids from the request
     utclist = request.GET.getlist('id', [])
-    print(utclist)
+    limit = min(max(get_value_from_request(request, 'limit', PAGE_SIZE), 1),
+                MAX_PAGE_SIZE)
+    cursor = get_value_from_request(request, 'cursor', None)
+    start, end = get_date_range(request)
 
+    tz = get_localzone()
     test_list_instances = models.TestListInstance.objects.filter(
         unit_test_collection__id__in=utclist
-    ).values("id", "work_completed")
+    ).order_by('-work_completed', '-id')
+    if start is not None:
+        test_list_instances = test_list_instances.filter(
+            work_completed__gte=start)
+    if end is not None:
+        test_list_instances = test_list_instances.filter(
+            work_completed__lt=end)
+    if cursor is not None:
+        # Continue after the last instance of the previous page
+        last = models.TestListInstance.objects.filter(
+            pk=cursor).values_list('work_completed', flat=True)
+        if last:
+            test_list_instances = test_list_instances.filter(
+                Q(work_completed__lt=last[0]) |
+                Q(work_completed=last[0], id__lt=cursor))
+
+    test_list_instances = list(test_list_instances.values(
+        "id", "work_completed")[:limit + 1])
 
     datedict = {}
-    for x in test_list_instances:
-        date = x['work_completed'].astimezone(
-            get_localzone()).strftime(dtformat)
-        x.update({'work_completed': x['work_completed'].astimezone(
-            get_localzone()).strftime(localformat)})
-        if date in datedict:
-            datedict[date].append(x)
-        else:
-            datedict[date] = [x]
+    for x in test_list_instances[:limit]:
+        # Convert to local time once for both the date and the time
+        local = x['work_completed'].astimezone(tz)
+        x['work_completed'] = local.strftime(localformat)
+        datedict.setdefault(local.strftime(dtformat), []).append(x)
 
-    json_context = json.dumps(
-        {"test_list_instances": datedict})
+    # Keep the instances of each date in chronological order
+    for x in datedict.values():
+        x.reverse()
+
+    json_context = json.dumps({
+        "test_list_instances": datedict,
+        "next": test_list_instances[limit - 1]['id']
+        if len(test_list_instances) > limit else None})
 
     return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
 
@@ -118,64 +172,475 @@ def get_value_from_request(request, param, default, dtype=int):
     return v
 
 
-def get_plot(request):
-    """Return a PNG plot of the requested PBS Daily QA data."""
+def get_reference(unit, work_completed):
+    """Return the reference table of the unit at the time of the test."""
+
+    return reftables.get_reference(
+        unit, work_completed.astimezone(get_localzone()).strftime(dtformat))
+
+
+def get_file_date(work_completed):
+    """Return the date (YYYYMMDD) of the test expected in the name of the
+       exported spot file."""
+
+    return work_completed.astimezone(get_localzone()).strftime(filedtformat)
+
+
+def get_spot_file(request):
+    """Return the path to the spot file of the requested TestListInstance.
+
+       Returns the path, the reference table of the unit on the day of the
+       test and the date expected in the exported file name along with an
+       error response, either the path, reference and date or the error are
+       None.
+    """
 
     # Get the primary key for the test instance and obtain the filenames
     pk = get_value_from_request(request, 'id', 0)
     tests = models.TestInstance.objects.filter(
         test_list_instance_id=pk
-    ).values('string_value', 'unit_test_info_id')
+    ).values('string_value', 'unit_test_info_id', 'unit_test_info__unit_id',
+             'work_completed')
 
     spot_uti = get_value_from_request(request, 'spot_uti', None)
     # Determine the spot filename
-    spotfilename = [t['string_value'] for t in tests
-                    if t['unit_test_info_id'] == spot_uti]
+    spottests = [t for t in tests if t['unit_test_info_id'] == spot_uti]
+    spotfilename = [t['string_value'] for t in spottests]
 
     # Return if the test list is empty or the spot filename is invalid
     if not len(tests) or not len(spotfilename):
         json_context = "No data found for id: " + str(pk) + str(tests) + str(spotfilename) + str(spot_uti)
+        return None, None, None, HttpResponse(
+            json_context, content_type=JSON_CONTENT_TYPE)
+
+    reference = get_reference(spottests[0]['unit_test_info__unit_id'],
+                              spottests[0]['work_completed'])
+    return os.path.join(settings.UPLOAD_ROOT, str(pk), spotfilename[0]), \
+        reference, get_file_date(spottests[0]['work_completed']), None
+
+
+def invalid_file_response(e):
+    """Return the error response of a spot file that failed validation."""
+
+    json_context = json.dumps({'Error': str(e)})
+    return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE,
+                        status=400)
+
+
+def get_spotdata(request):
+    """Return the analysed PBS Daily QA data for plotting in the browser."""
+
+    spot, reference, date, error = get_spot_file(request)
+    if error:
+        return error
+
+    gaussian = bool(get_value_from_request(request, 'gaussian', 0))
+    method = get_value_from_request(request, 'background', 'global', str)
+    if method not in background.METHODS:
+        error_msg = {'Invalid parameters': {
+                     'background': method},
+                     'Allowable parameters': {
+                     'background': background.METHODS}}
+        json_context = json.dumps(error_msg)
         return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
-    else:
-        # Initialize the PBS Daily QA analysis with the spot file
-
-        spot = os.path.join(settings.UPLOAD_ROOT, str(pk), spotfilename[0])
-        spots, spotdata = analysis.read_file(spot)
-
-        # Get the plot parameters from the request
-        axis = get_value_from_request(request, 'axis', 'x', str)
-        plot_type = get_value_from_request(
-            request, 'plot_type', 'profile', str)
-        annotations = get_value_from_request(
-            request, 'annotations', 'position', str)
-
-        # Check if parameters are valid
-        if (axis not in ['x', 'y']) or \
-           (annotations not in ['position', 'size']) or \
-           (plot_type not in ['profile', 'spot']):
-
-            error_msg = {'Invalid parameters': {
-                         'plot_type': plot_type,
-                         'annotations': annotations,
-                         'axis': axis},
-                         'Allowable parameters': {
-                         'plot_type': ['profile', 'spot'],
-                         'annotations': ['position', 'size'],
-                         'axis': ['x', 'y']}}
-            json_context = json.dumps(error_msg)
-            return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
-
-        # Return the requested plot image
-        fig = analysis.plot_data(
-            spotdata,
-            plot_type=plot_type,
-            annotations=annotations,
-            axis=axis)
-        canvas = FigureCanvas(fig)
-        # response = HttpResponse(content_type='image/svg+xml')
-        # fig.savefig(response, format="svg")
-        response = HttpResponse(content_type='image/png')
-        canvas.print_png(response)
+
+    # The default options are left out of the cache key, so the default
+    # analysis shares the cache with the other views
+    try:
+        spots, spotdata = cache.read_file(
+            spot, date=date, reference=reference, gaussian=gaussian,
+            background_method=method)
+    except ValueError as e:
+        return invalid_file_response(e)
+
+    json_context = json.dumps(serializers.spot_payload(spotdata))
+
+    return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+
+def get_plot(request):
+    """Return a PNG plot of the requested PBS Daily QA data."""
+
+    with timing.stage('query'):
+        spot, reference, date, error = get_spot_file(request)
+    if error:
+        return error
+
+    # Get the plot parameters from the request
+    axis = get_value_from_request(request, 'axis', 'x', str)
+    plot_type = get_value_from_request(
+        request, 'plot_type', 'profile', str)
+    annotations = get_value_from_request(
+        request, 'annotations', 'position', str)
+
+    # Check if parameters are valid
+    if (axis not in ['x', 'y']) or \
+       (annotations not in ['position', 'size']) or \
+       (plot_type not in ['profile', 'spot']):
+
+        error_msg = {'Invalid parameters': {
+                     'plot_type': plot_type,
+                     'annotations': annotations,
+                     'axis': axis},
+                     'Allowable parameters': {
+                     'plot_type': ['profile', 'spot'],
+                     'annotations': ['position', 'size'],
+                     'axis': ['x', 'y']}}
+        json_context = json.dumps(error_msg)
+        return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+    # Return the pre-rendered plot image, rendering it in the render pool
+    # if it is not available
+    with timing.stage('hash'):
+        sha = cache.file_hash(spot)
+    try:
+        with timing.stage('render_wait'):
+            path, status = render.request_plot(
+                sha, plot_type, annotations, axis, reference, filename=spot,
+                date=date)
+    except ValueError as e:
+        return invalid_file_response(e)
+    return plot_response(request, path, status)
+
+
+def plot_response(request, path, status):
+    """Return the rendered plot, or ask the client to retry the request
+       later if the plot is still being rendered (202) or too many plots are
+       waiting to be rendered (503)."""
+
+    if status == 'missing':
+        raise Http404("No analysis found for: " + path)
+    if status != 'done':
+        json_context = json.dumps({
+            'status': status,
+            'retry': request.get_full_path(),
+            'retry_after': render.RETRY_AFTER})
+        response = HttpResponse(json_context, content_type=JSON_CONTENT_TYPE,
+                                status=202 if status == 'pending' else 503)
+        response['Retry-After'] = str(render.RETRY_AFTER)
+        response['Location'] = request.get_full_path()
         return response
 
+    with timing.stage('read_png'):
+        with open(path, 'rb') as f:
+            return HttpResponse(f.read(), content_type='image/png')
+
+
+def get_verdicts(request):
+    """Return the pass, tol or fail verdict of every check of the analysis
+       of the requested TestListInstance, with a status code of each check
+       (0 pass, 1 tol, 2 fail) for automated checks."""
+
+    spot, reference, date, error = get_spot_file(request)
+    if error:
+        return error
+
+    try:
+        with timing.stage('analysis'):
+            spots, spotdata = cache.read_file(
+                spot, date=date, reference=reference)
+    except ValueError as e:
+        return invalid_file_response(e)
+    result = verdicts.summary(spotdata)
+    result.update({
+        'id': get_value_from_request(request, 'id', 0),
+        'spots': reference.spots['name'].tolist(),
+        'reference': reference.key})
+
+    json_context = json.dumps(result)
+
+    return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+
+def get_spot_files(request):
+    """Return the paths to the spot files of the TestListInstances to
+       compare (id) and of the TestListInstances forming the reference
+       (reference), e.g. the commissioning baseline or the last week.
+
+       Returns the paths of the files and of the references along with an
+       error response, either the paths or the error are None."""
+
+    try:
+        pks = [int(pk) for pk in request.GET.getlist('id')]
+        references = [int(pk) for pk in request.GET.getlist('reference')]
+    except ValueError:
+        pks = references = []
+    spot_uti = get_value_from_request(request, 'spot_uti', None)
+
+    if not pks or not references or spot_uti is None:
+        error_msg = {'Invalid parameters': {
+                     'id': request.GET.getlist('id'),
+                     'reference': request.GET.getlist('reference'),
+                     'spot_uti': request.GET.get('spot_uti')},
+                     'Allowable parameters': {
+                     'id': 'one or more TestListInstance ids',
+                     'reference': 'one or more TestListInstance ids',
+                     'spot_uti': 'UnitTestInfo id of the spot file'}}
+        json_context = json.dumps(error_msg)
+        return None, None, HttpResponse(
+            json_context, content_type=JSON_CONTENT_TYPE)
+
+    # Get the spot files of every TestListInstance in one query
+    tests = models.TestInstance.objects.filter(
+        test_list_instance_id__in=pks + references,
+        unit_test_info_id=spot_uti
+    ).values('test_list_instance_id', 'string_value')
+    paths = dict(
+        (t['test_list_instance_id'], os.path.join(
+            settings.UPLOAD_ROOT, str(t['test_list_instance_id']),
+            t['string_value'])) for t in tests)
+
+    missing = [pk for pk in pks + references if pk not in paths]
+    if missing:
+        json_context = "No data found for id: " + str(missing)
+        return None, None, HttpResponse(
+            json_context, content_type=JSON_CONTENT_TYPE)
+
+    return [paths[pk] for pk in pks], [paths[pk] for pk in references], None
+
+
+def get_comparison_data(request):
+    """Return the comparison of the requested spot files or an error."""
+
+    filenames, references, error = get_spot_files(request)
+    if error:
+        return None, error
+
+    try:
+        with timing.stage('analysis'):
+            return compare.compare_files(filenames, references), None
+    except ValueError as e:
+        json_context = json.dumps({'Error': str(e)})
+        return None, HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+
+def get_comparison(request):
+    """Return the position and size of the spots of each requested file
+       and their differences from the reference."""
+
+    comparison, error = get_comparison_data(request)
+    if error:
+        return error
+
+    json_context = json.dumps(serializers.comparison_summary(comparison))
+
     return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+
+def get_comparison_plot(request):
+    """Return a PNG plot of the spot profiles of the requested files
+       overlaid on the reference, or of the difference of the spots of the
+       first file from the reference."""
+
+    # Get the plot parameters from the request
+    axis = get_value_from_request(request, 'axis', 'x', str)
+    annotations = get_value_from_request(
+        request, 'annotations', 'overlay', str)
+
+    # Check if parameters are valid
+    if (axis not in ['x', 'y']) or \
+       (annotations not in ['overlay', 'difference']):
+
+        error_msg = {'Invalid parameters': {
+                     'annotations': annotations,
+                     'axis': axis},
+                     'Allowable parameters': {
+                     'annotations': ['overlay', 'difference'],
+                     'axis': ['x', 'y']}}
+        json_context = json.dumps(error_msg)
+        return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+    filenames, references, error = get_spot_files(request)
+    if error:
+        return error
+
+    # Compare and render in the render pool, as the other plots are
+    try:
+        with timing.stage('render_wait'):
+            path, status = render.request_comparison(
+                filenames, references, annotations, axis)
+    except ValueError as e:
+        return invalid_file_response(e)
+    return plot_response(request, path, status)
+
+
+def get_trend(request):
+    """Return the trend of the analysis results of the spots of a unit."""
+
+    unit = get_value_from_request(request, 'unit', None)
+    names = reftables.spot_names()
+    spots = request.GET.getlist('spot') or names
+    values = request.GET.getlist('value') or \
+        ['positionX', 'positionY', 'SpotSizeX', 'SpotSizeY']
+
+    # Select the last year of results unless a date range is requested
+    try:
+        end = datetime.datetime.strptime(
+            request.GET['to'], dtformat).date() \
+            if 'to' in request.GET else datetime.date.today()
+        start = datetime.datetime.strptime(
+            request.GET['from'], dtformat).date() \
+            if 'from' in request.GET else \
+            end - datetime.timedelta(
+                days=get_value_from_request(request, 'days', 365))
+    except ValueError:
+        start = end = None
+
+    # Check if parameters are valid
+    invalid_spots = [s for s in spots if s not in names]
+    invalid_values = [v for v in values if v not in trends.VALUES]
+    if unit is None or start is None or invalid_spots or invalid_values:
+        error_msg = {'Invalid parameters': {
+                     'unit': unit,
+                     'spot': invalid_spots,
+                     'value': invalid_values,
+                     'from': request.GET.get('from'),
+                     'to': request.GET.get('to')},
+                     'Allowable parameters': {
+                     'spot': names,
+                     'value': trends.VALUES,
+                     'from': dtformat,
+                     'to': dtformat}}
+        json_context = json.dumps(error_msg)
+        return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+    # The expected values of each result are those of the reference table
+    # the file was analysed with
+    spotdict = {}
+    for spot in spots:
+        table = trends.trend(unit, spot, start, end)
+        keys = table['reference'].tolist()
+        tables = dict((k, reftables.expected_values(k, spot))
+                      for k in set(keys))
+        spotdict[spot] = dict(
+            (v, table[v].tolist()) for v in values)
+        spotdict[spot].update({
+            'tli': table['tli'].tolist(),
+            'dates': table['date'].astype(str).tolist(),
+            'reference': keys,
+            'expected': dict(
+                (v, [tables[k][v] if tables[k] else None for k in keys])
+                for v in reftables.EXPECTED)})
+
+    json_context = json.dumps({
+        'unit': unit,
+        'from': start.strftime(dtformat),
+        'to': end.strftime(dtformat),
+        'spots': spotdict})
+
+    return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+
+def get_day(request):
+    """Return the tests, analysis summary and plot URLs of every
+       TestListInstance of the given UnitTestCollections on the given date.
+    """
+
+    utclist = request.GET.getlist('id', [])
+    spot_uti = get_value_from_request(request, 'spot_uti', None)
+    start, end = get_date_range(request, 'date', 'date')
+
+    if start is None:
+        error_msg = {'Invalid parameters': {
+                     'date': request.GET.get('date')},
+                     'Allowable parameters': {
+                     'date': dtformat}}
+        json_context = json.dumps(error_msg)
+        return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+    # Get the tests of every TestListInstance of the day in one query
+    tests = models.TestInstance.objects.filter(
+        test_list_instance__unit_test_collection__id__in=utclist,
+        test_list_instance__work_completed__gte=start,
+        test_list_instance__work_completed__lt=end
+    ).order_by(
+        'test_list_instance__work_completed', 'test_list_instance_id'
+    ).values('test_list_instance_id', 'test_list_instance__work_completed',
+             'unit_test_info_id', 'unit_test_info__unit_id', 'string_value',
+             'value')
+
+    tz = get_localzone()
+    test_list_instances = OrderedDict()
+    references = {}
+    dates = {}
+    for t in tests:
+        pk = t.pop('test_list_instance_id')
+        work_completed = t.pop('test_list_instance__work_completed')
+        unit = t.pop('unit_test_info__unit_id')
+        if pk not in test_list_instances:
+            test_list_instances[pk] = {
+                'id': pk,
+                'work_completed': work_completed.astimezone(
+                    tz).strftime(localformat),
+                'tests': []}
+            references[pk] = get_reference(unit, work_completed)
+            dates[pk] = get_file_date(work_completed)
+        test_list_instances[pk]['tests'].append(t)
+
+    for pk, tli in test_list_instances.items():
+        spotfilename = [t['string_value'] for t in tli['tests']
+                        if t['unit_test_info_id'] == spot_uti]
+        spot = os.path.join(settings.UPLOAD_ROOT, str(pk),
+                            spotfilename[0]) if spotfilename else None
+        if not spot or not os.path.isfile(spot):
+            continue
+
+        sha = cache.file_hash(spot)
+        try:
+            spots, spotdata = cache.read_file(
+                spot, date=dates[pk], reference=references[pk])
+        except ValueError as e:
+            tli['error'] = str(e)
+            continue
+        tli['analysis'] = serializers.spot_summary(spotdata)
+        tli['plots'] = dict(
+            ('_'.join(v), reverse('pbsanalysis_render', kwargs={
+                'sha': sha, 'version': render.VERSION_TAG,
+                'reference': references[pk].key,
+                'plot_type': v[0], 'annotations': v[1], 'axis': v[2]}))
+            for v in render.variants())
+
+    json_context = json.dumps({
+        'date': request.GET['date'],
+        'test_list_instances': list(test_list_instances.values())})
+
+    return HttpResponse(json_context, content_type=JSON_CONTENT_TYPE)
+
+
+def get_render(request, sha, version, reference, plot_type, annotations,
+               axis):
+    """Return the plot of the analysed spot file with the given hash.
+
+       The URL changes with the content of the file, the versions of the
+       analysis and plots and the reference table, so the image can be cached
+       indefinitely."""
+
+    if version != render.VERSION_TAG:
+        raise Http404("Outdated plot version: " + version)
+    key = reference
+    reference = reftables.by_key(key)
+    if reference is None:
+        raise Http404("Unknown reference table: " + key)
+
+    with timing.stage('render_wait'):
+        path, status = render.request_plot(
+            sha, plot_type, annotations, axis, reference)
+    response = plot_response(request, path, status)
+    if status == 'done':
+        response['Cache-Control'] = 'public, max-age=31536000'
+    return response
+
+
+def get_metrics(request):
+    """Return the stage timing metrics of this process for Prometheus.
+
+       Only requests from the addresses in PBS_DAILY_QA_METRICS_IPS
+       (default: localhost) are allowed."""
+
+    allowed = getattr(settings, 'PBS_DAILY_QA_METRICS_IPS',
+                      ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+
+    return HttpResponse(timing.metrics(),
+                        content_type='text/plain; version=0.0.4')
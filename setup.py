@@ -1,5 +1,5 @@
 import os
-from setuptools import setup
+from setuptools import setup, find_packages
 
 with open(os.path.join(os.path.dirname(__file__), 'README.rst')) as readme:
     README = readme.read()
@@ -10,7 +10,7 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 setup(
     name='qatrack-pbsdailyqa',
     version='0.2',
-    packages=['pbsdailyqa'],
+    packages=find_packages(exclude=['pbsdailyqaproject']),
     include_package_data=True,
     license='MIT License',
     description='A Django app for QATrack+ to review and analyze ' +